@@ -1,13 +1,23 @@
-import requests
 import json
-import urllib3
 import re
-import time
 
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 from decimal import Decimal
 
+from common import numeric
+from common.cli import finish, parse_args, setup
+from common.extract import Const, Spec, compile_spec
+from common.html import make_soup
+from common.http import page_of, session
+from common.identity import fingerprint
+from common.memo import normalizer
+from common.output import dump
+from common.parse_pool import ParsePool
+from common.pipeline import Job, Pipeline, Throttle
+from common.quarantine import QUARANTINE, Rejected, Row
+from common.sink import SINK
+from common.stats import STATS
+
 
 class EstateObject():
 
@@ -63,36 +73,52 @@ class EstateObject():
             return value.replace(',', '.')
         return value
 
+    # у всех объектов комплекса одни и те же сырые строки: см. common.memo
+    @staticmethod
+    @normalizer
+    def _complex_name(value, city):
+        name = re.search('«[\d,\D]*»', value)
+        if name:
+            return name.group(0) + " (" + city + ")"
+        restricted_parts = ['\t', '\n', 'жк', "«", "»", 'апартаменты']
+        value = EstateObject.remove_restricted(value, restricted_parts)
+        return value + " (" + city + ")"
+
+    @staticmethod
+    @normalizer
+    def _phase_name(value):
+        restricted_parts = ['очередь']
+        return EstateObject.remove_restricted(value, restricted_parts)
+
+    @staticmethod
+    @normalizer
+    def _building_name(value):
+        restricted_parts = ['корпус', 'корп.', 'корп', '№', 'дом', ':',
+                            '\t', '\n', 'квартал']
+        return EstateObject.remove_restricted(value, restricted_parts)
+
+    @staticmethod
+    @normalizer
+    def _section_name(value):
+        restricted_parts = ['секция', '№', ':', '\t', 'подъезд']
+        return EstateObject.remove_restricted(value, restricted_parts)
+
     def set_complex(self, value, city):
         if 'апартамент' in value:
             self.type = 'apartment'
-
-        name = re.search('«[\d,\D]*»', value)
-        if name:
-            self.complex = name.group(0) + " (" + city + ")"
-        else:
-            restricted_parts = ['\t', '\n', 'жк', "«", "»", 'апартаменты']
-            value = self.remove_restricted(value, restricted_parts)
-            self.complex = value + " (" + city + ")"
+        self.complex = self._complex_name(value, city)
 
     def set_obj_type(self, value):
         self.type = value
 
     def set_phase(self, value):
-        restricted_parts = ['очередь']
-        value = self.remove_restricted(value, restricted_parts)
-        self.phase = value
+        self.phase = self._phase_name(value)
 
     def set_building(self, value):
-        restricted_parts = ['корпус', 'корп.', 'корп', '№', 'дом', ':',
-                            '\t', '\n', 'квартал']
-        value = self.remove_restricted(value, restricted_parts)
-        self.building = value
+        self.building = self._building_name(value)
 
     def set_section(self, value):
-        restricted_parts = ['секция', '№', ':', '\t', 'подъезд']
-        value = self.remove_restricted(value, restricted_parts)
-        self.section = value
+        self.section = self._section_name(value)
 
     def _decode_price(self, value, multi=1):
         if isinstance(value, str) and 'запрос' in value:
@@ -102,13 +128,13 @@ class EstateObject():
         value = self.correct_decimal_delimeter(value)
         value = self.remove_restricted(value, restricted_parts)
         if value:
-            return round(Decimal(value) * multi, 0)
+            return numeric.price(value, multi)
 
     def _check_price_value(self, price):
         if price:
             if (price > 0 and price < 10000) or \
                     price > 1000000 * 100000:
-                raise Exception('Wrong price value')
+                raise Rejected('price_range', 'Wrong price value')
 
     def set_price_base(self, value, sale=None, multi=1):
         self.price_base = self._decode_price(value, multi)
@@ -118,7 +144,7 @@ class EstateObject():
                 if price_sale < self.price_base:
                     self.price_sale = price_sale
                 elif price_sale > self.price_base:
-                    raise Exception('wrong price order')
+                    raise Rejected('price_order', 'wrong price order')
         self._check_price_value(self.price_base)
 
     def _area_cleaner(self, value) -> Decimal:
@@ -128,7 +154,7 @@ class EstateObject():
         if isinstance(value, str):
             value = re.findall(r'[+-]?[0-9]*[.]?[0-9]+', value)[0]
         # value = self.remove_restricted(value, restricted_parts)
-        return Decimal(value)
+        return numeric.area(value)
 
     def set_area(self, value):
         self.area = self._area_cleaner(value)
@@ -192,12 +218,12 @@ class EstateObject():
 
     def set_in_sale(self, value=1):
         if value not in [0, 1, None]:
-            raise Exception('Wrong object in_sale attribute', value)
+            raise Rejected('in_sale', 'Wrong object in_sale attribute', value)
         self.in_sale = value
 
     def set_finished(self, value=0):
         if value not in [0, 1, None, 'optional']:
-            raise Exception('Wrong object finished attribute', value)
+            raise Rejected('finished', 'Wrong object finished attribute', value)
         self.finished = value
 
     def set_currency(self, value):
@@ -256,7 +282,7 @@ class EstateObject():
 
     def set_furniture(self, value=0):
         if value not in [0, 1, 'optional', None]:
-            raise Exception('Wrong object furniture attribute', value)
+            raise Rejected('furniture', 'Wrong object furniture attribute', value)
         self.furniture = value
 
     def set_plan(self, url, base_url=None):
@@ -282,7 +308,7 @@ class EstateObject():
     def set_euro_planning(self, value):
         value = int(value)
         if value not in [0, 1, None]:
-            raise Exception('Wrong object euro_planning attribute', value)
+            raise Rejected('euro_planning', 'Wrong object euro_planning attribute', value)
         self.euro_planning = value
 
     def set_sale(self, value):
@@ -302,7 +328,7 @@ class EstateObject():
         self._swap_base_price_and_finish_price()
         self._validate_prices()
         if self.type not in EstateObject.possible_types:
-            raise Exception('Wrong object type', self.type)
+            raise Rejected('type', 'Wrong object type', self.type)
 
     def _set_not_in_sale_if_no_price(self):
         if not (self.price_base or self.price_sale or self.price_finished
@@ -321,23 +347,25 @@ class EstateObject():
     def _validate_prices(self):
         if self.price_base and self.price_sale:
             if self.price_base < self.price_sale:
-                raise Exception('Wrond sale price', self.price_base,
-                                self.price_sale)
+                raise Rejected('sale_price', 'Wrond sale price', self.price_base,
+                               self.price_sale)
 
         if self.price_finished and self.price_finished_sale:
             if self.price_finished < self.price_finished_sale:
-                raise Exception('Wrond price_finished_sale price',
-                                self.price_finished,
-                                self.price_finished_sale)
+                raise Rejected('finished_sale_price',
+                               'Wrond price_finished_sale price',
+                               self.price_finished,
+                               self.price_finished_sale)
 
         if self.discount_percent and self.discount_percent > 30:
-            raise Exception('Too big discount rate', self.discount_percent)
+            raise Rejected('discount', 'Too big discount rate', self.discount_percent)
 
     def __eq__(self, other):
         return self.__dict__ == other.__dict__
 
     def __hash__(self):
-        return hash(tuple(sorted(self.__dict__.items())))
+        # хэш содержимого по всем полям, как и __eq__; списки в view/feature не мешают
+        return fingerprint(self.__dict__)[1]
 
     def __repr__(self):
         return str(self.__dict__)
@@ -351,9 +379,7 @@ class DecimalEncoder(json.JSONEncoder):
 
 
 # ________ utils ________________
-urllib3.disable_warnings()
 loaded_objects = []
-session = requests.Session()
 
 URL_BASE = 'https://abscity.ru/novostroiki-spb/page-'
 
@@ -365,110 +391,138 @@ class EstateInstance(EstateObject):
         self.type = 'flat'
 
 
-def load_data():
-    # ищем номер последней сраницы
-    with session.get(URL_BASE + str(1), verify=False) as req:
-        soup = BeautifulSoup(req.text, features='html5lib')
-        max_page = int(re.search('\d{1,3}', soup.find("a", class_='pagination__item _last')['href']).group(0))
-
-    for page in range(1, max_page+1):
-        time.sleep(0.5)
-        with session.get(URL_BASE+str(page), verify=False) as req:
-            soup = BeautifulSoup(req.text, features='html5lib')
-            links = list(map(lambda tag: tag.div.a['href'],
-                             soup.find_all('div', class_='catalog-list__item catalog-card')))
-            # есть два типа ссылок, например: https://abscity.ru/novostroiki-spb/zhk-126/ и https://kleny.abscity.ru/
-            for link in links:
-                if "abscity.ru/novostroiki-spb" in link:
-                    with session.get(link, verify=False) as req:
-                        soup = BeautifulSoup(req.text, features='html5lib')
-
-                        complex = soup.find("div", class_='about-block__title')
-                        # не всегда название в одном и том же месте
-                        if complex:
-                            complex = complex.h1.text
-                        else:
-                            complex = soup.find('h1', class_='hero__title')
-                            if complex:
-                                complex = complex.text
-                            else:
-                                continue
-
-                        flats = soup.find_all("tr", class_='prices-plans-table__tr')
-                        for flat in flats:
-                            save_JS_obj(extract_data_1(complex, flat))
-                else:
-                    with session.get(link, verify=False) as req:
-                        soup = BeautifulSoup(req.text, features='html5lib')
-
-                        complex = soup.find("div", class_='about-block__title')
-                        # не всегда название в одном и том же месте
-                        if complex:
-                            complex = complex.h1.text
-                        else:
-                            complex = soup.find('h1', class_='hero__title')
-                            if complex:
-                                complex = complex.text
-                            else:
-                                continue
-
-                        flats = soup.find_all("div", class_='rooms-item')
-                        for flat in flats:
-                            save_JS_obj(extract_data_2(complex, flat, link))
-
-
-def extract_data_1(complex, data):
-    obj = EstateInstance()
-
-    obj.set_complex(complex, 'Санкт-Петербург')
-    obj.set_phase(data['data-queue'])
-    obj.set_building(data['data-block'])
-    obj.set_finishing_name(data['data-otdelka'])
-    if obj.finished == 1:
-        obj.set_price_finished(data['data-price'])
-    else:
-        obj.set_price_base(data['data-price'])
-    obj.set_area(data['data-pl'])
-    obj.set_rooms(data['data-kv'])
-    obj.set_floor(data['data-floor'])
-    obj.set_plan('https://abscity.ru/'+data.td.img['src'])
-    return obj
-
-
-def extract_data_2(complex, data, link):
-    if 'rooms-item_button' in data['class']:
-        return None
-    if not data['data-price'] or int(data['data-price']) < 1_000_000:
-        return None
-
-    obj = EstateInstance()
-
-    obj.set_complex(complex, 'Ленинградская область')
-    obj.set_phase(data['data-queue'])
-    obj.set_building(data['data-block'])
-    obj.set_finishing_name(data['data-otdelka'])
+def fetch(url):
+    with session().get(url, verify=False) as req:
+        return page_of(req)
+
+
+def parse_pages(page):
+    # ищем номер последней сраницы, первая страница уже загружена
+    soup = make_soup(page)
+    max_page = int(re.search('\d{1,3}', soup.find("a", class_='pagination__item _last')['href']).group(0))
+    for page in range(2, max_page + 1):
+        yield Job(URL_BASE + str(page), 'listing')
+    yield from parse_listing(page, soup)
+
+
+def parse_listing(page, soup=None):
+    soup = soup or make_soup(page)
+    links = list(map(lambda tag: tag.div.a['href'],
+                     soup.find_all('div', class_='catalog-list__item catalog-card')))
+    # есть два типа ссылок, например: https://abscity.ru/novostroiki-spb/zhk-126/ и https://kleny.abscity.ru/
+    for link in links:
+        if "abscity.ru/novostroiki-spb" in link:
+            yield Job(link, 'complex_1')
+        else:
+            yield Job(link, 'complex_2', (link,))
+
+
+def find_complex(soup):
+    complex = soup.find("div", class_='about-block__title')
+    # не всегда название в одном и том же месте
+    if complex:
+        return complex.h1.text
+    complex = soup.find('h1', class_='hero__title')
+    if complex:
+        return complex.text
+
+
+def parse_complex_1(page):
+    soup = make_soup(page)
+    complex = find_complex(soup)
+    if not complex:
+        return
+    flats = soup.find_all("tr", class_='prices-plans-table__tr')
+    for flat in flats:
+        yield Row(extract_data_1, (complex, flat), flat)
+
+
+def parse_complex_2(page, link):
+    soup = make_soup(page)
+    complex = find_complex(soup)
+    if not complex:
+        return
+    flats = soup.find_all("div", class_='rooms-item')
+    for flat in flats:
+        yield Row(extract_data_2, (complex, flat, link), flat)
+
+
+HANDLERS = {
+    'pages': parse_pages,
+    'listing': parse_listing,
+    'complex_1': parse_complex_1,
+    'complex_2': parse_complex_2,
+}
+
+
+def set_price(obj, value):
     if obj.finished == 1:
-        obj.set_price_finished(data['data-price'])
+        obj.set_price_finished(value)
     else:
-        obj.set_price_base(data['data-price'])
-    obj.set_area(data['data-pl'])
-    obj.set_rooms(data.find('div', class_='rooms-item__title').text)
-    obj.set_floor(data['data-floor'])
-    obj.set_plan(link+data.find("div", class_='rooms-item__img').img['src'])
-    return obj
+        obj.set_price_base(value)
+
+
+extract_data_1 = compile_spec('extract_data_1', Spec(
+    factory=EstateInstance,
+    args=('complex', 'data'),
+    row='data',
+    fields=[
+        ('set_complex', ('complex', Const('Санкт-Петербург'))),
+        ('set_phase', '@data-queue'),
+        ('set_building', '@data-block'),
+        ('set_finishing_name', '@data-otdelka'),
+        (set_price, '@data-price'),
+        ('set_area', '@data-pl'),
+        ('set_rooms', '@data-kv'),
+        ('set_floor', '@data-floor'),
+        ('set_plan', lambda complex, data: 'https://abscity.ru/'+data.td.img['src']),
+    ],
+), timer='setters')
+
+
+extract_data_2 = compile_spec('extract_data_2', Spec(
+    factory=EstateInstance,
+    args=('complex', 'data', 'link'),
+    row='data',
+    skip=lambda complex, data, link: ('rooms-item_button' in data['class'] or
+                                      not data['data-price'] or int(data['data-price']) < 1_000_000),
+    fields=[
+        ('set_complex', ('complex', Const('Ленинградская область'))),
+        ('set_phase', '@data-queue'),
+        ('set_building', '@data-block'),
+        ('set_finishing_name', '@data-otdelka'),
+        (set_price, '@data-price'),
+        ('set_area', '@data-pl'),
+        ('set_rooms', lambda complex, data, link: data.find('div', class_='rooms-item__title').text),
+        ('set_floor', '@data-floor'),
+        ('set_plan', lambda complex, data, link: link+data.find("div", class_='rooms-item__img').img['src']),
+    ],
+), timer='setters')
+
+
+def finish_obj(obj):
+    # выполняется в процессе-обработчике
+    obj.final_check()
+    return obj.__dict__
 
 
 def save_JS_obj(obj):
-    if obj:
-        obj.final_check()
-        loaded_objects.append(obj.__dict__)
+    loaded_objects.append(obj)
+    SINK.add(obj)
+    STATS.incr('accepted')
 
 
-def price():
-    load_data()
-    print(json.dumps(loaded_objects, cls=DecimalEncoder, indent=1,
-                     sort_keys=False, ensure_ascii=False))
+def price(args):
+    setup(args, 'abscity')
+    pool = ParsePool.from_args(HANDLERS, finish_obj, args)
+    # микросайты *.abscity.ru грузятся параллельно с abscity.ru, у каждого хоста свой интервал
+    pipeline = Pipeline(fetch, pool, save_JS_obj, throttle=Throttle(0.5),
+                        on_error=QUARANTINE.page_error, lanes=True, prefetch=('listing',),
+                        recrawl=('complex_1', 'complex_2'))
+    pipeline.run([Job(URL_BASE + str(1), 'pages')])
+    dump(loaded_objects, args, cls=DecimalEncoder, indent=1)
+    finish(args)
 
 
 if __name__ == "__main__":
-    price()
+    price(parse_args())
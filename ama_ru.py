@@ -1,13 +1,23 @@
-import requests
 import json
-import urllib3
 import re
-import time
 
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 from decimal import Decimal
 
+from common import numeric
+from common.cli import finish, parse_args, setup
+from common.extract import Spec, compile_spec
+from common.http import body_stream, page_of, session
+from common.identity import fingerprint
+from common.jsonstream import items
+from common.memo import intern, normalizer
+from common.output import dump
+from common.parse_pool import ParsePool
+from common.pipeline import Job, Pipeline, Throttle
+from common.quarantine import QUARANTINE, Rejected, Row
+from common.sink import SINK
+from common.stats import STATS
+
 
 class EstateObject():
 
@@ -63,33 +73,47 @@ class EstateObject():
             return value.replace(',', '.')
         return value
 
-    def set_complex(self, value, region):
+    # у всех объектов комплекса одни и те же сырые строки: см. common.memo
+    @staticmethod
+    @normalizer
+    def _complex_name(value, region):
         restricted_parts = ['\t', '\n', 'жк', '"']
-        value = self.remove_restricted(value, restricted_parts)
+        value = EstateObject.remove_restricted(value, restricted_parts)
         if region == 'МО':
             region = 'Московская область'
         elif region == 'СПб':
             region = 'Санкт-Петербург'
         elif region == 'ЛО':
             region == 'Ленинградская область'
-        self.complex = value.capitalize()+' ('+region+')'
+        return value.capitalize()+' ('+region+')'
+
+    @staticmethod
+    @normalizer
+    def _building_name(value):
+        restricted_parts = ['корпус', 'корп.', 'корп', '№', 'дом', ':',
+                            '\t', '\n', 'квартал']
+        return EstateObject.remove_restricted(value, restricted_parts)
+
+    @staticmethod
+    @normalizer
+    def _section_name(value):
+        restricted_parts = ['секция', '№', ':', '\t', 'подъезд']
+        return EstateObject.remove_restricted(value, restricted_parts)
+
+    def set_complex(self, value, region):
+        self.complex = self._complex_name(value, region)
 
     def set_obj_type(self, value):
         self.type = value
 
     def set_phase(self, value):
-        self.phase = value
+        self.phase = intern(value)
 
     def set_building(self, value):
-        restricted_parts = ['корпус', 'корп.', 'корп', '№', 'дом', ':',
-                            '\t', '\n', 'квартал']
-        value = self.remove_restricted(value, restricted_parts)
-        self.building = value
+        self.building = self._building_name(value)
 
     def set_section(self, value):
-        restricted_parts = ['секция', '№', ':', '\t', 'подъезд']
-        value = self.remove_restricted(value, restricted_parts)
-        self.section = value
+        self.section = self._section_name(value)
 
     def _decode_price(self, value, multi=1):
         if isinstance(value, str) and 'запрос' in value:
@@ -99,13 +123,13 @@ class EstateObject():
         value = self.correct_decimal_delimeter(value)
         value = self.remove_restricted(value, restricted_parts)
         if value:
-            return round(Decimal(value) * multi, 0)
+            return numeric.price(value, multi)
 
     def _check_price_value(self, price):
         if price:
             if (price > 0 and price < 10000) or \
                     price > 1000000 * 100000:
-                raise Exception('Wrong price value')
+                raise Rejected('price_range', 'Wrong price value')
 
     def set_price_base(self, value, sale=None, multi=1):
         self.price_base = self._decode_price(value, multi)
@@ -115,7 +139,7 @@ class EstateObject():
                 if price_sale < self.price_base:
                     self.price_sale = price_sale
                 elif price_sale > self.price_base:
-                    raise Exception('wrong price order')
+                    raise Rejected('price_order', 'wrong price order')
         self._check_price_value(self.price_base)
 
     def _area_cleaner(self, value) -> Decimal:
@@ -125,7 +149,7 @@ class EstateObject():
         if isinstance(value, str):
             value = re.findall(r'[+-]?[0-9]*[.]?[0-9]+', value)[0]
         # value = self.remove_restricted(value, restricted_parts)
-        return Decimal(value)
+        return numeric.area(value)
 
     def set_area(self, value):
         self.area = self._area_cleaner(value)
@@ -184,12 +208,12 @@ class EstateObject():
 
     def set_in_sale(self, value=1):
         if value not in [0, 1, None]:
-            raise Exception('Wrong object in_sale attribute', value)
+            raise Rejected('in_sale', 'Wrong object in_sale attribute', value)
         self.in_sale = value
 
     def set_finished(self, value=0):
         if value not in [0, 1, None, 'optional']:
-            raise Exception('Wrong object finished attribute', value)
+            raise Rejected('finished', 'Wrong object finished attribute', value)
         self.finished = value
 
     def set_currency(self, value):
@@ -241,7 +265,7 @@ class EstateObject():
 
     def set_furniture(self, value=0):
         if value not in [0, 1, 'optional', None]:
-            raise Exception('Wrong object furniture attribute', value)
+            raise Rejected('furniture', 'Wrong object furniture attribute', value)
         self.furniture = value
 
     def set_plan(self, url, base_url=None):
@@ -267,7 +291,7 @@ class EstateObject():
     def set_euro_planning(self, value):
         value = int(value)
         if value not in [0, 1, None]:
-            raise Exception('Wrong object euro_planning attribute', value)
+            raise Rejected('euro_planning', 'Wrong object euro_planning attribute', value)
         self.euro_planning = value
 
     def set_sale(self, value):
@@ -287,7 +311,7 @@ class EstateObject():
         self._swap_base_price_and_finish_price()
         self._validate_prices()
         if self.type not in EstateObject.possible_types:
-            raise Exception('Wrong object type', self.type)
+            raise Rejected('type', 'Wrong object type', self.type)
 
     def _set_not_in_sale_if_no_price(self):
         if not (self.price_base or self.price_sale or self.price_finished
@@ -306,23 +330,25 @@ class EstateObject():
     def _validate_prices(self):
         if self.price_base and self.price_sale:
             if self.price_base < self.price_sale:
-                raise Exception('Wrond sale price', self.price_base,
-                                self.price_sale)
+                raise Rejected('sale_price', 'Wrond sale price', self.price_base,
+                               self.price_sale)
 
         if self.price_finished and self.price_finished_sale:
             if self.price_finished < self.price_finished_sale:
-                raise Exception('Wrond price_finished_sale price',
-                                self.price_finished,
-                                self.price_finished_sale)
+                raise Rejected('finished_sale_price',
+                               'Wrond price_finished_sale price',
+                               self.price_finished,
+                               self.price_finished_sale)
 
         if self.discount_percent and self.discount_percent > 30:
-            raise Exception('Too big discount rate', self.discount_percent)
+            raise Rejected('discount', 'Too big discount rate', self.discount_percent)
 
     def __eq__(self, other):
         return self.__dict__ == other.__dict__
 
     def __hash__(self):
-        return hash(tuple(sorted(self.__dict__.items())))
+        # хэш содержимого по всем полям, как и __eq__; списки в view/feature не мешают
+        return fingerprint(self.__dict__)[1]
 
     def __repr__(self):
         return str(self.__dict__)
@@ -336,9 +362,7 @@ class DecimalEncoder(json.JSONEncoder):
 
 
 # ________ utils ________________
-urllib3.disable_warnings()
 loaded_objects = []
-session = requests.Session()
 
 URL_BASE = 'https://ama.ru/api/buildings?skip={}&limit=10'
 
@@ -352,56 +376,88 @@ class EstateInstance(EstateObject):
 
 
 
-def load_data():
-
-    with session.get(URL_BASE.format(0), verify=False) as req:
-        data = json.loads(req.text)
-        total_items = data['total']
-    with session.get(f'https://ama.ru/api/buildings?skip=0&limit={total_items}', verify=False) as req:
-            data = json.loads(req.text)
-            id = []
-            for complex in data['items']:
-                if complex['flatsCount'] != 0:
-                    id.append(complex['id'])
-    for i in id:
-        with session.get(f'https://ama.ru/api/buildings?buildingId={i}&skip=0&limit=60', verify=False) as req:
-            data = json.loads(req.text)['items'][0]
-            for flat in data['flats']:
-                save_JS_obj(extract_data(flat,
-                                         data['building']['name'],
-                                         data['building']['apartment'],
-                                         data['address']['district']))
-
-
-def extract_data(data, complex, is_apartment, region):
-    obj = EstateObject()
-
-    if is_apartment:
-        obj.set_obj_type('apartment')
-    else:
-        obj.set_obj_type('flat')
-    obj.set_complex(complex, region)
-    obj.set_area(data['area'])
-    obj.set_floor(data['floor'])
-    obj.set_plan(data['img'])
-    obj.set_rooms(data['rooms'])
-    obj.set_price_base(data['price'])
+def fetch(url):
+    with session().get(url, verify=False) as req:
+        return page_of(req)
+
+
+def building_jobs(throttle):
+    '''
+    Задания по зданиям. Ответ со всеми зданиями сразу (limit=total) большой:
+    здания разбираются по одному, пока ответ загружается (как каталог PIK).
+    '''
+    url = URL_BASE.format(0)
+    throttle.wait(url)
+    with STATS.timer('fetch'):
+        with session().get(url, verify=False) as req:
+            total_items = req.json()['total']
+    STATS.incr('requests')
+    url = f'https://ama.ru/api/buildings?skip=0&limit={total_items}'
+    throttle.wait(url)
+    with STATS.timer('fetch'):
+        with session().get(url, verify=False, stream=True) as response:
+            jobs = [Job(f'https://ama.ru/api/buildings?buildingId={complex["id"]}&skip=0&limit=60', 'building')
+                    for complex in items(body_stream(response), 'items.item')
+                    if complex['flatsCount'] != 0]
+    STATS.incr('requests')
+    return jobs
+
+
+def parse_building(page):
+    data = json.loads(page)['items'][0]
+    for flat in data['flats']:
+        yield Row(extract_data, (flat,
+                                 data['building']['name'],
+                                 data['building']['apartment'],
+                                 data['address']['district']))
+
+
+HANDLERS = {
+    'building': parse_building,
+}
+
+
+extract_data = compile_spec('extract_data', Spec(
+    factory=EstateObject,
+    args=('data', 'complex', 'is_apartment', 'region'),
+    fields=[
+        ('set_obj_type', lambda data, complex, is_apartment, region: 'apartment' if is_apartment else 'flat'),
+        ('set_complex', ('complex', 'region')),
+        ('set_area', '@area'),
+        ('set_floor', '@floor'),
+        ('set_plan', '@img'),
+        ('set_rooms', '@rooms'),
+        ('set_price_base', '@price'),
+    ],
     # на сайте была опечка (вместо 9млн написно 900тыс) и с ней код не проходил автоматическую проверку
-    if obj.price_base and obj.area and obj.price_base/obj.area > 20_000:
-        return obj
+    check=lambda obj: obj.price_base and obj.area and obj.price_base/obj.area > 20_000,
+), timer='setters')
+
+
+def finish_obj(obj):
+    # выполняется в процессе-обработчике
+    obj.final_check()
+    return obj.__dict__
 
 
 def save_JS_obj(obj):
-    if obj:
-        obj.final_check()
-        loaded_objects.append(obj.__dict__)
+    loaded_objects.append(obj)
+    SINK.add(obj)
+    STATS.incr('accepted')
 
 
-def price():
-    load_data()
-    print(json.dumps(loaded_objects, cls=DecimalEncoder, indent=1,
-                     sort_keys=False, ensure_ascii=False))
+def price(args):
+    setup(args, 'ama')
+    pool = ParsePool.from_args(HANDLERS, finish_obj, args)
+    # как у остальных сайтов: 0.5сек между запросами, общий журнал (--rate-ledger)
+    # и адаптивный интервал (--pace)
+    throttle = Throttle(0.5)
+    pipeline = Pipeline(fetch, pool, save_JS_obj, throttle=throttle, on_error=QUARANTINE.page_error,
+                        recrawl=('building',))
+    pipeline.run(building_jobs(throttle))
+    dump(loaded_objects, args, cls=DecimalEncoder, indent=1)
+    finish(args)
 
 
 if __name__ == "__main__":
-    price()
+    price(parse_args())
@@ -1,13 +1,24 @@
-import requests
+import html
 import json
-import urllib3
 import re
-import time
 
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 from decimal import Decimal
 
+from common import numeric
+from common.cli import finish, parse_args, setup
+from common.extract import Spec, compile_spec
+from common.html import make_soup, page_text, scan_rows
+from common.http import page_of, session
+from common.identity import IdentityIndex, fingerprint
+from common.memo import intern, normalizer
+from common.output import dump
+from common.parse_pool import ParsePool
+from common.pipeline import Job, Pipeline, Throttle
+from common.quarantine import QUARANTINE, Rejected, Row
+from common.sink import SINK
+from common.stats import STATS
+
 
 class EstateObject():
 
@@ -63,32 +74,47 @@ class EstateObject():
             return value.replace(',', '.')
         return value
 
-    def set_complex(self, value):
+    # у всех объектов комплекса одни и те же сырые строки: см. common.memo
+    @staticmethod
+    @normalizer
+    def _complex_name(value):
         value = value.split(',')
         restricted_parts = ['\t', '\n', 'жк', 'г.']
-        value[1] = self.remove_restricted(value[1], restricted_parts)
-        value[0] = self.remove_restricted(value[0], restricted_parts)
+        value[1] = EstateObject.remove_restricted(value[1], restricted_parts)
+        value[0] = EstateObject.remove_restricted(value[0], restricted_parts)
         value[1] = re.sub(r'\([\w,\W]*\)', '', value[1])
-        self.complex = value[1].capitalize() + f' ({value[0].capitalize()})'
+        return value[1].capitalize() + f' ({value[0].capitalize()})'
+
+    @staticmethod
+    @normalizer
+    def _building_name(value):
+        restricted_parts = ['корпус', 'корп.', 'корп', '№', 'дом', ':',
+                            '\t', '\n', 'квартал']
+        return EstateObject.remove_restricted(value, restricted_parts)
+
+    @staticmethod
+    @normalizer
+    def _section_name(value):
+        restricted_parts = ['секция', '№', ':', '\t', 'подъезд']
+        return EstateObject.remove_restricted(value, restricted_parts)
+
+    def set_complex(self, value):
+        self.complex = self._complex_name(value)
 
     def set_obj_type(self, value):
         self.type = value
 
     def set_phase(self, value):
-        self.phase = value
+        self.phase = intern(value)
 
     def set_building(self, value):
         if value:
             if "ЖК" not in value:
-                restricted_parts = ['корпус', 'корп.', 'корп', '№', 'дом', ':',
-                                    '\t', '\n', 'квартал']
-                value = self.remove_restricted(value, restricted_parts)
-                self.building = value
+                self.building = self._building_name(value)
 
     def set_section(self, value):
         if value:
-            restricted_parts = ['секция', '№', ':', '\t', 'подъезд']
-            value = self.remove_restricted(value, restricted_parts)
+            value = self._section_name(value)
             if value:
                 self.section = value
 
@@ -100,13 +126,13 @@ class EstateObject():
         value = self.correct_decimal_delimeter(value)
         value = self.remove_restricted(value, restricted_parts)
         if value:
-            return round(Decimal(value) * multi, 0)
+            return numeric.price(value, multi)
 
     def _check_price_value(self, price):
         if price:
             if (price > 0 and price < 10000) or \
                     price > 1000000 * 100000:
-                raise Exception('Wrong price value')
+                raise Rejected('price_range', 'Wrong price value')
 
     def set_price_base(self, value, sale=None, multi=1):
         self.price_base = self._decode_price(value, multi)
@@ -116,7 +142,7 @@ class EstateObject():
                 if price_sale < self.price_base:
                     self.price_sale = price_sale
                 elif price_sale > self.price_base:
-                    raise Exception('wrong price order')
+                    raise Rejected('price_order', 'wrong price order')
         self._check_price_value(self.price_base)
 
     def _area_cleaner(self, value) -> Decimal:
@@ -126,7 +152,7 @@ class EstateObject():
         if isinstance(value, str):
             value = re.findall(r'[+-]?[0-9]*[.]?[0-9]+', value)[0]
         # value = self.remove_restricted(value, restricted_parts)
-        return Decimal(value)
+        return numeric.area(value)
 
     def set_area(self, value):
         if value:
@@ -189,12 +215,12 @@ class EstateObject():
 
     def set_in_sale(self, value=1):
         if value not in [0, 1, None]:
-            raise Exception('Wrong object in_sale attribute', value)
+            raise Rejected('in_sale', 'Wrong object in_sale attribute', value)
         self.in_sale = value
 
     def set_finished(self, value=0):
         if value not in [0, 1, None, 'optional']:
-            raise Exception('Wrong object finished attribute', value)
+            raise Rejected('finished', 'Wrong object finished attribute', value)
         self.finished = value
 
     def set_currency(self, value):
@@ -246,7 +272,7 @@ class EstateObject():
 
     def set_furniture(self, value=0):
         if value not in [0, 1, 'optional', None]:
-            raise Exception('Wrong object furniture attribute', value)
+            raise Rejected('furniture', 'Wrong object furniture attribute', value)
         self.furniture = value
 
     def set_plan(self, url, base_url=None):
@@ -272,7 +298,7 @@ class EstateObject():
     def set_euro_planning(self, value):
         value = int(value)
         if value not in [0, 1, None]:
-            raise Exception('Wrong object euro_planning attribute', value)
+            raise Rejected('euro_planning', 'Wrong object euro_planning attribute', value)
         self.euro_planning = value
 
     def set_sale(self, value):
@@ -292,7 +318,7 @@ class EstateObject():
         self._swap_base_price_and_finish_price()
         self._validate_prices()
         if self.type not in EstateObject.possible_types:
-            raise Exception('Wrong object type', self.type)
+            raise Rejected('type', 'Wrong object type', self.type)
 
     def _set_not_in_sale_if_no_price(self):
         if not (self.price_base or self.price_sale or self.price_finished
@@ -311,23 +337,25 @@ class EstateObject():
     def _validate_prices(self):
         if self.price_base and self.price_sale:
             if self.price_base < self.price_sale:
-                raise Exception('Wrond sale price', self.price_base,
-                                self.price_sale)
+                raise Rejected('sale_price', 'Wrond sale price', self.price_base,
+                               self.price_sale)
 
         if self.price_finished and self.price_finished_sale:
             if self.price_finished < self.price_finished_sale:
-                raise Exception('Wrond price_finished_sale price',
-                                self.price_finished,
-                                self.price_finished_sale)
+                raise Rejected('finished_sale_price',
+                               'Wrond price_finished_sale price',
+                               self.price_finished,
+                               self.price_finished_sale)
 
         if self.discount_percent and self.discount_percent > 30:
-            raise Exception('Too big discount rate', self.discount_percent)
+            raise Rejected('discount', 'Too big discount rate', self.discount_percent)
 
     def __eq__(self, other):
         return self.__dict__ == other.__dict__
 
     def __hash__(self):
-        return hash(tuple(sorted(self.__dict__.items())))
+        # хэш содержимого по всем полям, как и __eq__; списки в view/feature не мешают
+        return fingerprint(self.__dict__)[1]
 
     def __repr__(self):
         return str(self.__dict__)
@@ -341,12 +369,15 @@ class DecimalEncoder(json.JSONEncoder):
 
 
 # ________ utils ________________
-urllib3.disable_warnings()
 loaded_objects = []
-session = requests.Session()
+# страницы корпусов пересекаются, один и тот же объект приходит несколько раз
+seen_objects = IdentityIndex()
 
 URL_BASE = 'https://www.azbuka.ru/newbuild/?PAGEN_2='
 URL_COMM = 'https://www.azbuka.ru/newbuild/commerc/?PAGEN_2='
+# в исходном html пробел может быть записан как &nbsp;
+CORPUS_RE = re.compile(r'корпус(?:\s|&nbsp;|&#160;)*\d+', re.I)
+PARKING_RE = re.compile('Машиноместа')
 
 
 class EstateInstance(EstateObject):
@@ -356,149 +387,190 @@ class EstateInstance(EstateObject):
         self.type = type
 
 
-def load_data_com():
-    # считываем количесво страниц
-    with session.get(URL_COMM + "1", verify=False) as req:
-        soup = BeautifulSoup(req.text, "html5lib")
-        ul = soup.find("ul", class_="uk-pagination")
-        if ul:
-            max_page = int(ul.find_all("li", class_=False)[-1].a.text)
-        else:
-            max_page = 1
-    for page in range(1, max_page + 1):
-        with session.get(URL_COMM + str(page), verify=False) as req:
-            soup = BeautifulSoup(req.text, "html5lib")
-            complexes = soup.find_all("div", class_='object-item')
-            complexes_link = list(map(lambda c: c.find_all('a')[1]['href'], complexes))
-            complexes_name = list(map(lambda c: c.find_all('a')[1].text, complexes))
-            complexes_addres = list(map(lambda c: c.find('div', class_='object-address').text.split(",")[0], complexes))
-            for i in range(len(complexes_link)):
-                time.sleep(0.5)
-                with session.get('https://www.azbuka.ru'+complexes_link[i], verify=False) as req:
-                    soup = BeautifulSoup(req.text, "html5lib")
-                    if not soup.find('div', class_='adaptive-table'):
-                        continue
-                    flats = soup.find('div', class_='adaptive-table').find_all('tr')[1:]
-                    corp_name = soup.find('div', class_='uk-width-medium-8-10').find('span').text
-                    for flat in flats:
-                        save_JS_obj(extract_comm(flat, complexes_addres[i]+', '+complexes_name[i], corp_name))
-                    # внутри помещения могут быть разбиты на странцы по корпусам
-                    corps = soup.find('div', class_='uk-width-medium-8-10')
-                    corps = corps.find_all('a')
-                    for corp in corps:
-                        time.sleep(0.5)
-                        with session.get('https://www.azbuka.ru' + corp['href'], verify=False) as req:
-                            soup = BeautifulSoup(req.text, "html5lib")
-                            if not soup.find('div', class_='adaptive-table'):
-                                continue
-                            flats = soup.find('div', class_='adaptive-table').find_all('tr')[1:]
-                            for flat in flats:
-                                save_JS_obj(extract_comm(flat, complexes_addres[i] + ', ' + complexes_name[i], corp.text))
-
-
-def load_data():
-    # считываем количесво страниц
-    with session.get(URL_BASE+"1", verify=False) as req:
-        soup = BeautifulSoup(req.text, "html5lib")
-        ul = soup.find("ul", class_="uk-pagination")
+def fetch(url):
+    with session().get(url, verify=False) as req:
+        return page_of(req)
+
+
+def parse_pages(page):
+    # считываем количесво страниц, первая страница уже загружена
+    soup = make_soup(page)
+    ul = soup.find("ul", class_="uk-pagination")
+    max_page = int(ul.find_all("li", class_=False)[-1].a.text)
+    for page in range(2, max_page + 1):
+        yield Job(URL_BASE + str(page), 'listing')
+    yield from parse_listing(page, soup)
+
+
+def parse_listing(page, soup=None):
+    soup = soup or make_soup(page)
+    for c in soup.find_all("div", class_='object-item'):
+        link = c.find('div', class_='uk-hidden-small').h2.a
+        park = c.find(string=PARKING_RE) is not None
+        url = 'https://www.azbuka.ru' + link['href']
+        yield Job(url, 'complex', (link.text, park, url))
+
+
+def parse_complex(page, complex, park, url):
+    soup = make_soup(page)
+    object_id = soup.find_all('tr', {'data-id': True})
+    if not object_id:
+        return
+    # получаем уникальные значения для id объекта
+    for id in sorted(set(map(lambda n: int(n['data-id']), object_id))):
+        # собираем квартиры для объекта
+        yield Job(f'https://www.azbuka.ru/newbuild/object/{id}/flats/', 'flats', (complex,))
+    # собираем паркоместа для объекта
+    if park:
+        yield Job(url + "parking", 'parking', (complex,))
+
+
+def parse_flats(page, complex):
+    # все данные квартиры в атрибутах строки, дерево не нужно
+    text = page_text(page)
+    flats = scan_rows(text, 'tr', container=('div', 'adaptive-table'), skip=1)
+    if flats is None:
+        return
+    corpus = CORPUS_RE.search(text)
+    if corpus:
+        corpus = html.unescape(corpus.group(0))
+    for flat in flats:
+        yield Row(extract_flat, (flat, complex, corpus))
+
+
+def parse_parking(page, complex):
+    # номер машиноместа только в тексте ячейки: дерево строится для каждой строки отдельно
+    parks = scan_rows(page, 'tr', container=('div', 'adaptive-table'), skip=1)
+    if parks is None:
+        raise ValueError('нет таблицы машиномест')
+    for park in parks:
+        yield Row(extract_park, (park, complex))
+
+
+def parse_comm_pages(page):
+    # считываем количесво страниц, первая страница уже загружена
+    soup = make_soup(page)
+    ul = soup.find("ul", class_="uk-pagination")
+    if ul:
         max_page = int(ul.find_all("li", class_=False)[-1].a.text)
-    for page in range(1, max_page+1):
-        with session.get(URL_BASE + str(page), verify=False) as req:
-            soup = BeautifulSoup(req.text, "html5lib")
-            complexes = soup.find_all("div", class_='object-item')
-            complexes_link = list(map(lambda c: c.find('div', class_='uk-hidden-small').h2.a['href'], complexes))
-            complexes_name = list(map(lambda c: c.find('div', class_='uk-hidden-small').h2.a.text, complexes))
-            complexes_park = list(map(lambda c: re.search('Машиноместа', str(c)), complexes))
-            for i in range(len(complexes_link)):
-                time.sleep(0.5)
-                with session.get('https://www.azbuka.ru'+complexes_link[i], verify=False) as req:
-                    soup = BeautifulSoup(req.text, "html5lib")
-                    object_id = soup.find_all('tr', {'data-id': True})
-                    if object_id:
-                        # получаем уникальные значения для id объекта
-                        object_id = list(map(lambda n: int(n['data-id']), object_id))
-                        object_id = list(set(object_id))
-                    else:
-                        continue
-                for id in object_id:
-                    time.sleep(0.5)
-                    # собираем квартиры для объекта
-                    with session.get(f'https://www.azbuka.ru/newbuild/object/{id}/flats/', verify=False) as req:
-                        soup = BeautifulSoup(req.text, "html5lib")
-                        table = soup.find('div', class_='adaptive-table')
-                        if not table:
-                            continue
-                        corpus = re.search(r'корпус\s*\d+', str(soup), re.I)
-                        if corpus:
-                            corpus = corpus.group(0)
-                        flats = table.find_all('tr')[1:]
-                        for flat in flats:
-                            save_JS_obj(extract_flat(flat, complexes_name[i], corpus))
-                # собираем паркоместа для объекта
-                if complexes_park[i]:
-                    with session.get('https://www.azbuka.ru'+complexes_link[i]+"parking", verify=False) as req:
-                        soup = BeautifulSoup(req.text, "html5lib")
-                        parks = soup.find('div', class_='adaptive-table').find_all('tr')[1:]
-                        for park in parks:
-                            save_JS_obj(extract_park(park, complexes_name[i]))
-
-
-def extract_flat(data, complex, corpus):
-    obj = EstateInstance('flat')
-
-    obj.set_complex(complex)
-    obj.set_building(corpus)
-    obj.set_number(data['data-number'])
-    obj.set_plan(data['data-plan'], base_url='https://www.azbuka.ru')
-    obj.set_price_base(data['data-price'])
-    obj.set_section(data['data-section'])
-    obj.set_area(data['data-square'])
-    obj.set_rooms(data['data-rooms'])
-    obj.set_floor(data['data-floor'])
-
-    return obj
-
-
-def extract_park(data, complex):
-    obj = EstateInstance('parking')
-
-    obj.set_complex(complex)
-    obj.set_price_base(data['data-price'])
-    obj.set_section(data['data-section'])
-    obj.set_area(data['data-square'])
-    obj.set_floor(data['data-floor'])
-    obj.set_number(data.find_all('td')[2].text)
-
-    return obj
-
-
-def extract_comm(data, complex, corp):
-    obj = EstateInstance('commercial')
-
-    obj.set_complex(complex)
-    obj.set_number(data['data-number'])
-    obj.set_plan(data['data-plan'], base_url='https://www.azbuka.ru')
-    obj.set_price_base(data['data-price'])
-    obj.set_building(corp)
-    obj.set_section(data['data-section'])
-    obj.set_area(data['data-square'])
-    obj.set_floor(data['data-floor'])
-
-    return obj
+    else:
+        max_page = 1
+    for page in range(2, max_page + 1):
+        yield Job(URL_COMM + str(page), 'comm_listing')
+    yield from parse_comm_listing(page, soup)
+
+
+def parse_comm_listing(page, soup=None):
+    soup = soup or make_soup(page)
+    for c in soup.find_all("div", class_='object-item'):
+        link = c.find_all('a')[1]
+        address = c.find('div', class_='object-address').text.split(",")[0]
+        yield Job('https://www.azbuka.ru' + link['href'], 'comm_complex', (address + ', ' + link.text,))
+
+
+def parse_comm_complex(page, complex):
+    soup = make_soup(page)
+    if not soup.find('div', class_='adaptive-table'):
+        return
+    corps = soup.find('div', class_='uk-width-medium-8-10')
+    corp_name = corps.find('span').text
+    for flat in soup.find('div', class_='adaptive-table').find_all('tr')[1:]:
+        yield Row(extract_comm, (flat, complex, corp_name))
+    # внутри помещения могут быть разбиты на странцы по корпусам
+    for corp in corps.find_all('a'):
+        yield Job('https://www.azbuka.ru' + corp['href'], 'comm_corpus', (complex, corp.text))
+
+
+def parse_comm_corpus(page, complex, corp):
+    for flat in scan_rows(page, 'tr', container=('div', 'adaptive-table'), skip=1) or []:
+        yield Row(extract_comm, (flat, complex, corp))
+
+
+HANDLERS = {
+    'pages': parse_pages,
+    'listing': parse_listing,
+    'complex': parse_complex,
+    'flats': parse_flats,
+    'parking': parse_parking,
+    'comm_pages': parse_comm_pages,
+    'comm_listing': parse_comm_listing,
+    'comm_complex': parse_comm_complex,
+    'comm_corpus': parse_comm_corpus,
+}
+
+
+extract_flat = compile_spec('extract_flat', Spec(
+    factory=lambda: EstateInstance('flat'),
+    args=('data', 'complex', 'corpus'),
+    fields=[
+        ('set_complex', 'complex'),
+        ('set_building', 'corpus'),
+        ('set_number', '@data-number'),
+        ('set_plan', '@data-plan', {'base_url': 'https://www.azbuka.ru'}),
+        ('set_price_base', '@data-price'),
+        ('set_section', '@data-section'),
+        ('set_area', '@data-square'),
+        ('set_rooms', '@data-rooms'),
+        ('set_floor', '@data-floor'),
+    ],
+), timer='setters')
+
+
+extract_park = compile_spec('extract_park', Spec(
+    factory=lambda: EstateInstance('parking'),
+    args=('data', 'complex'),
+    fields=[
+        ('set_complex', 'complex'),
+        ('set_price_base', '@data-price'),
+        ('set_section', '@data-section'),
+        ('set_area', '@data-square'),
+        ('set_floor', '@data-floor'),
+        ('set_number', lambda data, complex: data.find_all('td')[2].text),
+    ],
+), timer='setters')
+
+
+extract_comm = compile_spec('extract_comm', Spec(
+    factory=lambda: EstateInstance('commercial'),
+    args=('data', 'complex', 'corp'),
+    fields=[
+        ('set_complex', 'complex'),
+        ('set_number', '@data-number'),
+        ('set_plan', '@data-plan', {'base_url': 'https://www.azbuka.ru'}),
+        ('set_price_base', '@data-price'),
+        ('set_building', 'corp'),
+        ('set_section', '@data-section'),
+        ('set_area', '@data-square'),
+        ('set_floor', '@data-floor'),
+    ],
+), timer='setters')
+
+
+def finish_obj(obj):
+    # выполняется в процессе-обработчике
+    obj.final_check()
+    return obj.__dict__
 
 
 def save_JS_obj(obj):
-    if obj:
-        obj.final_check()
-        loaded_objects.append(obj.__dict__)
+    if not seen_objects.add(*fingerprint(obj)):
+        STATS.incr('dedup:units')
+        return
+    loaded_objects.append(obj)
+    SINK.add(obj)
+    STATS.incr('accepted')
 
 
-def price():
-    load_data()
-    load_data_com()
-    print(json.dumps(loaded_objects, cls=DecimalEncoder, indent=1,
-                     sort_keys=False, ensure_ascii=False))
+def price(args):
+    setup(args, 'azbuka')
+    pool = ParsePool.from_args(HANDLERS, finish_obj, args)
+    pipeline = Pipeline(fetch, pool, save_JS_obj, throttle=Throttle(0.5),
+                        on_error=QUARANTINE.page_error, dedup_urls=True,
+                        prefetch=('listing', 'comm_listing'), recrawl=('complex', 'comm_complex'))
+    pipeline.run([Job(URL_BASE + "1", 'pages'), Job(URL_COMM + "1", 'comm_pages')])
+    dump(loaded_objects, args, cls=DecimalEncoder, indent=1)
+    finish(args)
 
 
 if __name__ == "__main__":
-    price()
+    price(parse_args())
@@ -0,0 +1,74 @@
+'''
+Время запуска парсеров: сколько стоит загрузить модуль сайта
+(без запросов и разбора). Каждый замер в новом процессе.
+
+    python benchmarks/import_time.py [сайт ...] [--repeat N] [--top N]
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.sites import SITES  # noqa: E402
+
+LOAD = 'from common.sites import load_site; load_site({!r})'
+# для сравнения: то, что раньше каждый скрипт импортировал сразу
+EAGER = 'import requests, urllib3, bs4, html5lib'
+
+
+def run(code: str, *options: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *options, '-c', code], cwd=ROOT,
+                          capture_output=True, text=True)
+
+
+def wall_time(code: str, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if run(code).returncode != 0:
+            return None
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def heaviest_imports(code: str, top: int):
+    # вывод -X importtime: "import time: self [us] | cumulative | imported package"
+    rows = []
+    for line in run(code, '-X', 'importtime').stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        rows.append((int(parts[1]), parts[2].rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='время импорта парсеров')
+    parser.add_argument('sites', nargs='*', default=sorted(SITES))
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--top', type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = wall_time('pass', args.repeat)
+    print(f'{"python -c pass":<24}{baseline * 1000:>10.1f} ms')
+    eager = wall_time(EAGER, args.repeat)
+    if eager is not None:
+        print(f'{"requests + bs4":<24}{eager * 1000:>10.1f} ms')
+    for site in args.sites:
+        code = LOAD.format(site)
+        median = wall_time(code, args.repeat)
+        if median is None:
+            print(f'{site:<24}{"error":>10}', run(code).stderr.strip().splitlines()[-1:])
+            continue
+        print(f'{site:<24}{median * 1000:>10.1f} ms')
+        for cumulative, name in heaviest_imports(code, args.top):
+            print(f'    {cumulative / 1000:>8.1f} ms {name.strip()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+'''
+Скорость разбора без сети: парсер отвечает из сохраненного набора страниц
+(--replay), паузы между запросами отключены. Каждый замер в новом процессе.
+
+Набор записывается обычным запуском с --record:
+
+    python -m common azbuka --record fixtures/azbuka > /dev/null
+    python benchmarks/replay.py azbuka fixtures/azbuka [--workers 0 4] [--repeat N]
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.sites import SITES  # noqa: E402
+
+
+def replay(site: str, corpus: str, workers: int, chunk_size: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        metrics = os.path.join(tmp, 'metrics.json')
+        command = [sys.executable, '-m', 'common', site, '--replay', corpus,
+                   '--workers', str(workers), '--chunk-size', str(chunk_size),
+                   '--metrics', metrics]
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1:]
+        with open(metrics, encoding='utf-8') as f:
+            return elapsed, json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='разбор из сохраненного набора страниц')
+    parser.add_argument('site', choices=sorted(SITES))
+    parser.add_argument('corpus', help='набор страниц (PATH.blob, PATH.idx)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, os.cpu_count() or 1])
+    parser.add_argument('--chunk-size', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"workers":<10}{"time":>10}{"pages/s":>12}{"objects/s":>12}')
+    for workers in args.workers:
+        times, stats = [], None
+        for _ in range(args.repeat):
+            elapsed, stats = replay(args.site, os.path.abspath(args.corpus), workers, args.chunk_size)
+            if elapsed is None:
+                break
+            times.append(elapsed)
+        if not times:
+            print(f'{workers:<10}{"error":>10}', stats)
+            continue
+        median = statistics.median(times)
+        counters = stats['counters']
+        pages = counters.get('cache_hits', 0)
+        objects = counters.get('accepted', 0)
+        print(f'{workers:<10}{median:>9.2f}s{pages / median:>12.1f}{objects / median:>12.1f}')
+        if counters.get('cache_misses'):
+            print(f'    нет в наборе: {counters["cache_misses"]} страниц')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+'''
+Общий код парсеров недвижимости.
+
+Модули грузятся лениво: `from common import Pipeline` импортирует только
+common.pipeline, а bs4/requests подтягиваются при первом разборе/запросе.
+'''
+from importlib import import_module
+
+_exports = {
+    'Job': 'common.pipeline',
+    'Pipeline': 'common.pipeline',
+    'Throttle': 'common.pipeline',
+    'ParsePool': 'common.parse_pool',
+    'STATS': 'common.stats',
+    'QUARANTINE': 'common.quarantine',
+    'Rejected': 'common.quarantine',
+    'Row': 'common.quarantine',
+    'parse_args': 'common.cli',
+    'load_site': 'common.sites',
+    'SITES': 'common.sites',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(import_module(_exports[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
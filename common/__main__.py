@@ -0,0 +1,27 @@
+'''
+Запуск одного парсера: python -m common <сайт> [параметры парсера]
+Проверка без запросов к сайту: python -m common --check <сайт>
+'''
+import sys
+
+from common.sites import SITES, load_site, run_site
+
+
+def main(argv):
+    if not argv or argv[0] in ('-h', '--help'):
+        print(__doc__.strip())
+        print('сайты:', ', '.join(sorted(SITES)))
+        return
+    if argv[0] == '--check':
+        for name in argv[1:] or sorted(SITES):
+            module = load_site(name)
+            handlers = getattr(module, 'HANDLERS', None)
+            print(name, 'ok', ', '.join(handlers) if handlers else '')
+        return
+    from common.cli import parse_args
+
+    run_site(argv[0], parse_args(argv[1:], description=f'парсер {argv[0]}'))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,106 @@
+import argparse
+import os
+
+
+def parse_args(argv=None, description: str = None) -> argparse.Namespace:
+    '''
+    Общие параметры запуска для всех парсеров недвижимости.
+    '''
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='кол-во процессов для разбора страниц, 0 - разбор в основном процессе')
+    parser.add_argument('--chunk-size', type=int, default=1,
+                        help='сколько загруженных страниц отдавать процессу за раз')
+    parser.add_argument('--gc-threshold', type=int, metavar='N',
+                        help='порог сборки поколения 0 (gc.set_threshold) в процессах разбора')
+    parser.add_argument('--max-tasks-per-child', type=int, metavar='N',
+                        help='заменять процессы разбора после N пачек на процесс')
+    parser.add_argument('--max-rss', type=float, metavar='MB',
+                        help='заменять процессы разбора, когда процесс занял больше MB памяти '
+                             '(сверх унаследованной от основного)')
+    parser.add_argument('--metrics', metavar='PATH',
+                        help='файл метрик: *.json - json, иначе формат Prometheus')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='записать cProfile стадии разбора (читается через pstats)')
+    parser.add_argument('--quarantine', metavar='PATH',
+                        help='сохранять отброшенные объекты с причиной (jsonl)')
+    parser.add_argument('--delta', metavar='PATH',
+                        help='выводить только изменения относительно снимка PATH (*.jsonl.gz) '
+                             'и обновить снимок')
+    parser.add_argument('--numeric', choices=('decimal', 'int'), default='decimal',
+                        help='цены и площади: Decimal или целые рубли и сотые м² (вывод тот же)')
+    parser.add_argument('--db', metavar='PATH',
+                        help='сохранять объекты в базу SQLite (последнее состояние и история цен)')
+    parser.add_argument('--db-batch', type=int, default=1000,
+                        help='сколько объектов записывать в базу одной транзакцией')
+    parser.add_argument('--rate-ledger', metavar='PATH',
+                        default=os.environ.get('PARSERS_RATE_LEDGER'),
+                        help='файл SQLite с общим для всех процессов интервалом запросов к хосту '
+                             '(по умолчанию $PARSERS_RATE_LEDGER)')
+    parser.add_argument('--schedule', metavar='PATH',
+                        help='файл SQLite со сроками обхода комплексов: обходить только те, '
+                             'у которых подошел срок (по частоте изменений), остальные - из прошлого обхода')
+    parser.add_argument('--budget', type=float, metavar='SEC',
+                        help='с --schedule: после SEC сек новые комплексы не начинать, '
+                             'они обходятся в следующий запуск')
+    parser.add_argument('--pace', choices=('adaptive', 'fixed'), default='adaptive',
+                        help='интервал запросов: adaptive - растет при медленных ответах, 429 и 5xx '
+                             'и возвращается к заданному, fixed - всегда заданный')
+    parser.add_argument('--slow', type=float, default=5.0, metavar='SEC',
+                        help='ответ дольше SEC сек считается медленным (--pace adaptive)')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='отвечать из сохраненного набора страниц PATH (без сети и пауз)')
+    parser.add_argument('--record', metavar='PATH',
+                        help='сохранять загруженные страницы в набор PATH')
+    return parser.parse_args(argv)
+
+
+def setup(args, site: str):
+    '''
+    Общая подготовка перед запуском парсера.
+    '''
+    from common import http, numeric
+    from common.pacing import PACER
+    from common.pipeline import Throttle
+    from common.quarantine import QUARANTINE
+    from common.schedule import SCHEDULE
+    from common.sink import SINK
+
+    QUARANTINE.open(args.quarantine)
+    SINK.open(args.db, site, args.db_batch)
+    SCHEDULE.open(args.schedule, site, args.budget)
+    numeric.configure(args.numeric)
+    if args.pace == 'adaptive':
+        PACER.open(args.slow)
+    if args.rate_ledger:
+        from common.ratelimit import Ledger
+
+        Throttle.ledger = Ledger(args.rate_ledger)
+    if args.record:
+        http.record_to(args.record)
+    if args.replay:
+        http.use_corpus(args.replay)
+        Throttle.enabled = False
+
+
+def finish(args):
+    '''
+    Итоги запуска: сводка, карантин, запись набора страниц.
+    '''
+    from common import http
+    from common.pacing import PACER
+    from common.pipeline import Throttle
+    from common.quarantine import QUARANTINE
+    from common.schedule import SCHEDULE
+    from common.sink import SINK
+    from common.stats import STATS, maxrss, report
+
+    SINK.close()
+    SCHEDULE.close()
+    PACER.close()
+    STATS.gauge('maxrss:main', maxrss())
+    report(args)
+    QUARANTINE.close()
+    http.close()
+    if Throttle.ledger:
+        Throttle.ledger.close()
@@ -0,0 +1,80 @@
+import json
+import mmap
+import os
+import threading
+
+from typing import Dict, Iterator, Optional, Tuple
+
+
+class CorpusWriter:
+    '''
+    Набор сохраненных страниц: PATH.blob - тела ответов подряд,
+    PATH.idx - json {url: [смещение, длина, кодировка из Content-Type или null]}.
+    Дописывает в существующий набор.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index: Dict[str, Tuple[int, int]] = {}
+        if os.path.exists(path + '.idx'):
+            with open(path + '.idx', encoding='utf-8') as f:
+                self.index = {url: tuple(item) for url, item in json.load(f).items()}
+        self._blob = open(path + '.blob', 'ab')
+        self._lock = threading.Lock()
+
+    def add(self, url: str, body: bytes, encoding: Optional[str] = None):
+        with self._lock:
+            offset = self._blob.seek(0, os.SEEK_END)
+            self._blob.write(body)
+            self.index[url] = (offset, len(body), encoding)
+
+    def close(self):
+        self._blob.close()
+        tmp = self.path + '.idx.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp, self.path + '.idx')
+
+
+class Corpus:
+    '''
+    Чтение набора через mmap: страницы не читаются с диска по одной,
+    view() отдает memoryview на кусок отображения без копирования,
+    get() - bytes (одно копирование, без декодирования в str).
+    '''
+
+    def __init__(self, path: str):
+        with open(path + '.idx', encoding='utf-8') as f:
+            self.index: Dict[str, Tuple[int, int]] = {url: tuple(item) for url, item in json.load(f).items()}
+        self._file = open(path + '.blob', 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self._view = memoryview(self._map)
+
+    def __contains__(self, url: str):
+        return url in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def urls(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def view(self, url: str) -> memoryview:
+        offset, length = self.index[url][:2]
+        return self._view[offset:offset + length]
+
+    def get(self, url: str) -> bytes:
+        offset, length = self.index[url][:2]
+        return self._map[offset:offset + length]
+
+    def encoding(self, url: str) -> Optional[str]:
+        # в наборах, записанных раньше, кодировки нет
+        item = self.index[url]
+        return item[2] if len(item) > 2 else None
+
+    def close(self):
+        self._view.release()
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
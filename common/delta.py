@@ -0,0 +1,81 @@
+import gzip
+import json
+import os
+
+from typing import Dict, List, Set
+
+from common.identity import IdentityIndex, fingerprint, identity, numbered
+
+
+def keyed(records: List[dict]) -> Dict[int, tuple]:
+    '''
+    Хэш ключа -> (хэш содержимого, объект), в порядке объектов. Одинаковые
+    объекты без номера различаем номером вхождения (common.identity.numbered).
+    '''
+    entries = sorted(fingerprint(record) + (i,) for i, record in enumerate(records))
+    unique = [None] * len(records)
+    for key_hash, content_hash, i in numbered(entries):
+        unique[i] = key_hash, content_hash
+    return {key_hash: (content_hash, record) for (key_hash, content_hash), record in zip(unique, records)}
+
+
+def load_records(path: str, wanted: Set[int]) -> Dict[int, dict]:
+    '''
+    Читает из снимка только нужные объекты, остальные не держим в памяти.
+    '''
+    records = {}
+    if not wanted or not os.path.exists(path):
+        return records
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            key_hash, record = json.loads(line)
+            if key_hash in wanted:
+                records[key_hash] = record
+    return records
+
+
+def save_snapshot(path: str, current: Dict[int, tuple]):
+    index = IdentityIndex()
+    tmp = path + '.tmp'
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+        for key_hash, (content_hash, record) in current.items():
+            index.add(key_hash, content_hash)
+            f.write(json.dumps([key_hash, record], ensure_ascii=False) + '\n')
+    # подменяем целиком, чтобы прерванный запуск не испортил прошлый снимок
+    os.replace(tmp, path)
+    index.save(path + '.idx')
+
+
+def delta(records: List[dict], path: str, cls=None) -> dict:
+    '''
+    Сравнивает объекты с прошлым запуском и сохраняет новый снимок.
+    Значения приводятся к виду после json (Decimal -> float), чтобы
+    сравнивать так же, как их увидит потребитель.
+
+    Неизмененные объекты отсеиваются по индексу хэшей (PATH.idx),
+    из самого снимка читаются только измененные и удаленные.
+    '''
+    records = json.loads(json.dumps(list(records), cls=cls, ensure_ascii=False))
+    current = keyed(records)
+    previous = IdentityIndex.load(path + '.idx')
+
+    insert, changed = [], []
+    for key_hash, (content_hash, record) in current.items():
+        state = previous.match(key_hash, content_hash)
+        if state == 'new':
+            insert.append(record)
+        elif state == 'changed':
+            changed.append(key_hash)
+    deleted = [key_hash for key_hash in previous.keys() if key_hash not in current]
+
+    old = load_records(path, set(changed) | set(deleted))
+    update = []
+    for key_hash in changed:
+        record, before = current[key_hash][1], old[key_hash]
+        changes = {field: [before.get(field), value] for field, value in record.items()
+                   if before.get(field) != value}
+        update.append({'key': identity(record), 'changes': changes})
+    delete = [identity(old[key_hash]) for key_hash in deleted]
+
+    save_snapshot(path, current)
+    return {'insert': insert, 'update': update, 'delete': delete}
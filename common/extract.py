@@ -0,0 +1,142 @@
+'''
+Описание извлечения объекта из строки таблицы/json вместо ручной
+последовательности obj.set_*:
+
+    extract_flat = compile_spec('extract_flat', Spec(
+        factory=lambda: EstateInstance('flat'),
+        args=('data', 'complex', 'corpus'),
+        fields=[
+            ('set_complex', 'complex'),
+            ('set_number', '@data-number'),
+            ('set_plan', '@data-plan', {'base_url': 'https://www.azbuka.ru'}),
+            ('set_number', lambda data, complex, corpus: data.find_all('td')[2].text),
+        ],
+    ), timer='setters')
+
+Поле - (нормализатор, источник[, именованные аргументы]):
+нормализатор - имя метода объекта или функция f(obj, значение...);
+источник - '@атрибут' строки (data-* у тега bs4, ключ у словаря), имя
+аргумента, Const(значение), функция от тех же аргументов, что и у
+извлечения, или кортеж источников для нескольких значений.
+
+Описание один раз компилируется в обычную функцию: все атрибуты строки
+читаются в начале одним проходом по словарю attrs, без Tag.__getitem__
+и без разбора описания на каждой строке. У функции есть batch(rows, ...)
+для пачки строк: тот же код в одном цикле, ошибка строки - элемент
+результата (как в Pipeline), а не обрыв пачки.
+'''
+from typing import Callable, NamedTuple, Optional, Sequence
+
+from common.stats import STATS
+
+
+class Const(NamedTuple):
+    '''
+    Источник-константа: ('set_complex', ('complex', Const('Санкт-Петербург'))).
+    '''
+    value: object
+
+
+class Spec(NamedTuple):
+    factory: Callable
+    args: Sequence[str]
+    fields: Sequence[tuple]
+    # имя аргумента со строкой, по умолчанию первый
+    row: Optional[str] = None
+    # skip(*args) -> True: строку пропустить (None), до создания объекта
+    skip: Optional[Callable] = None
+    # check(obj) -> False: объект не отдавать (None)
+    check: Optional[Callable] = None
+
+
+def _source(source, spec: Spec, namespace: dict, attrs: dict) -> str:
+    '''
+    Выражение для источника значения в сгенерированном коде.
+    '''
+    if isinstance(source, Const):
+        name = f'_const{len(namespace)}'
+        namespace[name] = source.value
+        return name
+    if isinstance(source, tuple):
+        return ', '.join(_source(item, spec, namespace, attrs) for item in source)
+    if callable(source):
+        name = f'_select{len(namespace)}'
+        namespace[name] = source
+        return f'{name}({", ".join(spec.args)})'
+    if source.startswith('@'):
+        if source not in attrs:
+            attrs[source] = f'_attr{len(attrs)}'
+        return attrs[source]
+    if source not in spec.args:
+        raise ValueError(f'{source!r}: нет такого аргумента в {spec.args}')
+    return source
+
+
+def _body(spec: Spec, namespace: dict, indent: str) -> list:
+    attrs = {}
+    calls = []
+    for field in spec.fields:
+        normalizer, source = field[0], field[1]
+        values = [_source(source, spec, namespace, attrs)]
+        for key, value in (field[2] if len(field) > 2 else {}).items():
+            namespace[f'_kw{len(namespace)}'] = value
+            values.append(f'{key}=_kw{len(namespace) - 1}')
+        if callable(normalizer):
+            namespace[f'_norm{len(namespace)}'] = normalizer
+            calls.append(f'_norm{len(namespace) - 1}(obj, {", ".join(values)})')
+        else:
+            calls.append(f'obj.{normalizer}({", ".join(values)})')
+
+    row = spec.row or spec.args[0]
+    lines = []
+    if spec.skip:
+        namespace['_skip'] = spec.skip
+        lines.append(f'if _skip({", ".join(spec.args)}): return None')
+    if attrs:
+        # у тега bs4 атрибуты в .attrs, у словаря из json - он сам
+        lines.append(f'attrs = getattr({row}, "attrs", {row})')
+        lines.extend(f'{name} = attrs[{attr[1:]!r}]' for attr, name in attrs.items())
+    lines.append('obj = _factory()')
+    lines.extend(calls)
+    if spec.check:
+        namespace['_check'] = spec.check
+        lines.append('if not _check(obj): return None')
+    return [indent + line for line in lines]
+
+
+def compile_spec(name: str, spec: Spec, timer: Optional[str] = None) -> Callable:
+    '''
+    Функция name(*spec.args) -> объект или None, и name.batch(rows, *остальные).
+    timer - имя таймера в STATS (например 'setters').
+    '''
+    namespace = {'_factory': spec.factory}
+    args = ', '.join(spec.args)
+    row = spec.row or spec.args[0]
+    rest = ', '.join(arg for arg in spec.args if arg != row)
+    body = _body(spec, namespace, '    ')
+    batch_body = _body(spec, namespace, '            ')
+    # в пачке return None - пропуск строки
+    batch_body = [line.replace('return None', 'result.append(None); continue') for line in batch_body]
+    source = '\n'.join([
+        f'def {name}({args}):',
+        *body,
+        '    return obj',
+        '',
+        f'def batch(rows{", " if rest else ""}{rest}):',
+        '    result = []',
+        f'    for {row} in rows:',
+        '        try:',
+        *batch_body,
+        '        except Exception as e:',
+        '            result.append(e)',
+        '            continue',
+        '        result.append(obj)',
+        '    return result',
+    ])
+    exec(compile(source, f'<spec {name}>', 'exec'), namespace)
+    extract, batch = namespace[name], namespace['batch']
+    if timer:
+        extract, batch = STATS.timed(timer)(extract), STATS.timed(timer)(batch)
+    extract.batch = batch
+    extract.source = source
+    return extract
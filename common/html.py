@@ -0,0 +1,160 @@
+'''
+Разбор html. bs4 и html5lib тяжелые, импортируются только там,
+где страницы действительно разбираются (в процессах-обработчиках).
+'''
+import re
+
+from html.parser import HTMLParser
+from typing import List, Optional
+
+from common.stats import STATS
+
+
+# деревья текущей страницы, разбираются в release_trees
+_trees = []
+# атрибуты-списки любого тега, как у bs4 (cdata_list_attributes)
+LIST_ATTRS = ('class', 'accesskey', 'dropzone')
+
+
+def make_soup(page, features: str = 'html5lib'):
+    from bs4 import BeautifulSoup
+
+    # кодировка из Content-Type (common.http.Page), как у response.text
+    encoding = None if isinstance(page, str) else getattr(page, 'encoding', None)
+    soup = BeautifulSoup(page, features=features, from_encoding=encoding)
+    _trees.append(soup)
+    return soup
+
+
+def release_trees():
+    '''
+    Разбирает (decompose) деревья, построенные для текущей страницы.
+    Дерево html5lib - тысячи объектов со ссылками друг на друга (parent,
+    next_element), без этого его освобождает только циклический gc, и
+    деревья нескольких страниц успевают накопиться. Вызывается из
+    parse_pool после страницы, когда объекты уже превращены в словари.
+    '''
+    if not _trees:
+        return
+    with STATS.timer('release'):
+        STATS.incr('trees:released', len(_trees))
+        while _trees:
+            _trees.pop().decompose()
+
+
+def page_text(page, encoding: Optional[str] = None) -> str:
+    '''
+    Текст ответа для поиска регулярным выражением по всей странице,
+    вместо str(soup) (который заново собирает html из всего дерева).
+    Кодировка - заданная, из Content-Type (common.http.Page) или utf-8.
+    '''
+    if isinstance(page, str):
+        return page
+    encoding = encoding or getattr(page, 'encoding', None) or 'utf-8'
+    return bytes(page).decode(encoding, errors='replace')
+
+
+class ScannedRow:
+    '''
+    Строка, найденная scan_rows: атрибуты без дерева (row['data-price'],
+    row.attrs). Все остальное (find_all, td, text) идет в дерево, которое
+    строится только для этой строки и только при первом обращении.
+    '''
+    __slots__ = ('name', 'attrs', 'source', '_tag')
+
+    def __init__(self, name: str, attrs: dict, source: str):
+        self.name = name
+        self.attrs = attrs
+        self.source = source
+        self._tag = None
+
+    def __getitem__(self, key):
+        return self.attrs[key]
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+    @property
+    def tag(self):
+        if self._tag is None:
+            STATS.incr('scan:tree')
+            # строку таблицы без таблицы html5lib выбросит
+            wrapped = f'<table>{self.source}</table>' if self.name == 'tr' else self.source
+            self._tag = make_soup(wrapped).find(self.name)
+        return self._tag
+
+    def __getattr__(self, name):
+        return getattr(self.tag, name)
+
+    def __str__(self):
+        return self.source
+
+
+def scan_rows(page, name: str, container: tuple = None, skip: int = 0) -> Optional[List[ScannedRow]]:
+    '''
+    Строки name (все вложенные, как find_all) внутри первого container -
+    (тег, класс), как soup.find(тег, class_=класс) - без построения дерева,
+    токенизатором html.parser. skip - пропустить первые (заголовок таблицы).
+    None, если container на странице нет.
+    '''
+    scanner = _RowScanner(page_text(page), name, container)
+    if container and not scanner.found:
+        return None
+    return scanner.rows[skip:]
+
+
+class _RowScanner(HTMLParser):
+
+    def __init__(self, text: str, name: str, container: Optional[tuple]):
+        super().__init__()
+        self.text = text
+        self.name = name
+        self.container = container
+        self.found = False
+        # вложенность тегов container внутри найденного, 0 - вне его
+        self.depth = 0 if container else 1
+        self.rows = []
+        self._start = None
+        self._lines = [0] + [m.end() for m in re.finditer('\n', text)]
+        self.feed(text)
+        self.close()
+        self._end_row(len(text))
+
+    def _offset(self) -> int:
+        line, column = self.getpos()
+        return self._lines[line - 1] + column
+
+    def _end_row(self, end: int):
+        if self._start is not None:
+            self.rows[-1].source = self.text[self._start:end]
+            self._start = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.container and tag == self.container[0]:
+            if self.depth:
+                self.depth += 1
+            elif not self.found and self.container[1] in (dict(attrs).get('class') or '').split():
+                self.found = True
+                self.depth = 1
+                return
+        if tag != self.name or not self.depth:
+            return
+        # строка без закрывающего тега закрывается следующей
+        self._end_row(self._offset())
+        values = {}
+        for key, value in attrs:
+            # как в html5lib: повторный атрибут не заменяет первый
+            value = '' if value is None else value
+            values.setdefault(key, value.split() if key in LIST_ATTRS else value)
+        self.rows.append(ScannedRow(tag, values, ''))
+        self._start = self._offset()
+        STATS.incr('scan:rows')
+
+    def handle_endtag(self, tag):
+        if tag == self.name and self._start is not None:
+            offset = self._offset()
+            self._end_row(self.text.find('>', offset) + 1 or len(self.text))
+        if self.container and tag == self.container[0] and self.depth:
+            self.depth -= 1
+            if not self.depth:
+                self._end_row(self._offset())
@@ -0,0 +1,182 @@
+'''
+HTTP для парсеров. requests и urllib3 импортируются при первом запросе,
+а не при загрузке модуля: запуск и проверка парсера их не требуют.
+
+Вместо сайта можно отвечать из сохраненного набора страниц
+(use_corpus, см. common.corpus) или записывать ответы в набор (record_to).
+'''
+import codecs
+import io
+import json
+import sys
+
+from typing import Optional
+from urllib.parse import urlsplit
+
+from common.pacing import PACER
+from common.stats import STATS
+
+_session = None
+_writer = None
+
+
+class Page(bytes):
+    '''
+    Тело ответа и кодировка из заголовка Content-Type (None - не указана,
+    тогда html5lib ищет meta charset). Переживает pickle в процессы разбора.
+    '''
+    encoding = None
+
+
+def page_of(response) -> Page:
+    '''
+    Тело ответа для обработчиков: байты без декодирования, но с кодировкой,
+    которую учитывал response.text.
+    '''
+    page = Page(response.content)
+    page.encoding = charset(response.headers.get('content-type', ''))
+    return page
+
+
+def charset(content_type: str) -> Optional[str]:
+    # только явно указанная: requests для text/* без charset подставляет ISO-8859-1
+    for part in content_type.split(';')[1:]:
+        key, _, value = part.strip().partition('=')
+        if key.lower() == 'charset':
+            value = value.strip('\'" ')
+            try:
+                # неизвестное имя - как не указанная
+                return codecs.lookup(value).name
+            except LookupError:
+                return None
+    return None
+
+
+class ReplayResponse:
+    status_code = 200
+
+    def __init__(self, url: str, content: bytes, encoding: Optional[str] = None):
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+        self.headers = {'content-type': f'text/html; charset={encoding}' if encoding else ''}
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or 'utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class ReplaySession:
+    '''
+    Подмена requests.Session: отвечает из набора страниц, без сети и файлов.
+    '''
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def get(self, url: str, **kwargs) -> ReplayResponse:
+        if url not in self.corpus:
+            STATS.incr('cache_misses')
+            raise KeyError(f'страницы нет в наборе: {url}')
+        STATS.incr('cache_hits')
+        return ReplayResponse(url, self.corpus.get(url), self.corpus.encoding(url))
+
+
+class RecordingSession:
+    '''
+    Обертка над requests.Session, сохраняющая тела успешных ответов.
+    '''
+
+    def __init__(self, session, writer):
+        self._session = session
+        self._writer = writer
+
+    def get(self, url: str, **kwargs):
+        response = self._session.get(url, **kwargs)
+        if response.status_code == 200:
+            self._writer.add(url, response.content, charset(response.headers.get('content-type', '')))
+        return response
+
+
+def session():
+    global _session
+    if _session is None:
+        import requests
+        import urllib3
+
+        urllib3.disable_warnings()
+        _session = requests.Session()
+        _session.headers['Accept-Encoding'] = accept_encoding()
+        _session.hooks['response'].append(_observe)
+        if _writer:
+            _session = RecordingSession(_session, _writer)
+    return _session
+
+
+def _observe(response, *args, **kwargs):
+    # время до заголовков и код ответа - для адаптивного интервала
+    PACER.observe(urlsplit(response.url).hostname,
+                  response.elapsed.total_seconds(), response.status_code)
+    return response
+
+
+def no_response(error: Exception) -> bool:
+    '''
+    Ошибка соединения или таймаут: ответа нет, _observe его не видел.
+    Коды 429/5xx и ошибки разбора тела ответа сюда не относятся.
+    '''
+    # requests загружен, только если запросы действительно шли в сеть
+    requests = sys.modules.get('requests')
+    return requests is not None and isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def accept_encoding() -> str:
+    # urllib3 распаковывает br, только если установлен brotli (или brotlicffi)
+    for module in ('brotli', 'brotlicffi'):
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        return 'gzip, deflate, br'
+    return 'gzip, deflate'
+
+
+def body_stream(response):
+    '''
+    Тело ответа как файл. Для get(..., stream=True) читается по мере
+    загрузки и распаковывается на лету, иначе - из уже загруженного.
+    '''
+    raw = getattr(response, 'raw', None)
+    if raw is None or getattr(response, '_content_consumed', False):
+        return io.BytesIO(response.content)
+    raw.decode_content = True
+    return raw
+
+
+def use_corpus(path: str):
+    global _session
+    from common.corpus import Corpus
+
+    _session = ReplaySession(Corpus(path))
+
+
+def record_to(path: str):
+    global _writer, _session
+    from common.corpus import CorpusWriter
+
+    _writer = CorpusWriter(path)
+    _session = None
+
+
+def close():
+    if _writer:
+        _writer.close()
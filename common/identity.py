@@ -0,0 +1,173 @@
+import os
+import struct
+
+from array import array
+from bisect import bisect_left
+from decimal import Decimal
+from hashlib import blake2b
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from common.numeric import Fixed
+
+# по этим полям объект узнается между запусками
+IDENTITY_FIELDS = ('complex', 'building', 'section', 'number', 'type')
+# если номера нет (abscity), различаем по этим
+FALLBACK_FIELDS = ('phase', 'floor', 'rooms', 'area')
+
+
+def canonical(value) -> str:
+    '''
+    Строка, одинаковая для равных значений: Decimal('30.50'), 30.5 и
+    Decimal('30.5') дают '30.5', списки и словари не зависят от порядка
+    вставки ключей и не ломают хэш (в отличие от hash(tuple(...))).
+    '''
+    if value is None:
+        return 'N'
+    if isinstance(value, bool):
+        return 'T' if value else 'F'
+    if isinstance(value, Fixed):
+        return 'n' + value.text()
+    if isinstance(value, (int, float, Decimal)):
+        number = Decimal(str(value)) if isinstance(value, float) else Decimal(value)
+        if not number.is_finite():
+            return 'n' + str(number)
+        if number == number.to_integral_value():
+            return 'n' + str(int(number))
+        return 'n' + format(number.normalize(), 'f')
+    if isinstance(value, str):
+        return 's' + value
+    if isinstance(value, (list, tuple)):
+        return '[' + '\x1f'.join(canonical(item) for item in value) + ']'
+    if isinstance(value, dict):
+        return '{' + '\x1f'.join(k + '\x1e' + canonical(value[k]) for k in sorted(value)) + '}'
+    return 'r' + repr(value)
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def identity(record: dict) -> Tuple:
+    key = tuple(record.get(field) for field in IDENTITY_FIELDS)
+    if record.get('number') is None:
+        key += tuple(record.get(field) for field in FALLBACK_FIELDS)
+    return key
+
+
+def fingerprint(record: dict) -> Tuple[int, int]:
+    '''
+    (хэш ключа, хэш содержимого) за один проход по полям, 64 бита каждый.
+    '''
+    fields = {name: canonical(value) for name, value in record.items()}
+    key = [fields.get(name, 'N') for name in IDENTITY_FIELDS]
+    if record.get('number') is None:
+        key += [fields.get(name, 'N') for name in FALLBACK_FIELDS]
+    content = '\x1f'.join(name + '\x1e' + fields[name] for name in sorted(fields))
+    return _digest('\x1f'.join(key)), _digest(content)
+
+
+def occurrence(key_hash: int, n: int) -> int:
+    # n-й объект с тем же ключом (одинаковые квартиры без номера)
+    return _digest(f'{key_hash}#{n}')
+
+
+def numbered(entries: Iterable[tuple]) -> Iterator[tuple]:
+    '''
+    Записи (хэш ключа, ...), упорядоченные по ключу и содержимому, с уникальным
+    ключом вместо хэша: одинаковые ключи (объекты без номера) получают номер
+    вхождения по порядку содержимого, а не по порядку загрузки, и объекты,
+    поменявшиеся местами на сайте, не выглядят измененными.
+    '''
+    last, n = None, 0
+    for entry in entries:
+        key_hash = entry[0]
+        n = n + 1 if key_hash == last else 1
+        last = key_hash
+        yield (key_hash if n == 1 else occurrence(key_hash, n),) + tuple(entry[1:])
+
+
+def site_key(site: str, key_hash: int) -> int:
+    # ключ объекта в базе нескольких сайтов: одинаковые поля на разных сайтах - разные объекты
+    return _digest(f'{site}#{key_hash}')
+
+
+class IdentityIndex:
+    '''
+    Ключ -> хэш содержимого.
+
+    Во время запуска - словарь (add для дедупликации), на диске - два
+    отсортированных массива uint64, поиск по ним бинарный. 16 байт на объект.
+    '''
+
+    _header = struct.Struct('<8sQ')
+    _magic = b'pyprsidx'
+
+    def __init__(self, keys: Optional[array] = None, contents: Optional[array] = None):
+        self._keys = keys if keys is not None else array('Q')
+        self._contents = contents if contents is not None else array('Q')
+        self._added: Dict[int, int] = {}
+
+    def __len__(self):
+        return sum(1 for _ in self.keys())
+
+    def add(self, key_hash: int, content_hash: int) -> bool:
+        '''
+        False, если такой же объект (ключ и содержимое) уже был.
+        '''
+        if self._added.get(key_hash) == content_hash:
+            return False
+        self._added[key_hash] = content_hash
+        return True
+
+    def get(self, key_hash: int) -> Optional[int]:
+        if key_hash in self._added:
+            return self._added[key_hash]
+        i = bisect_left(self._keys, key_hash)
+        if i < len(self._keys) and self._keys[i] == key_hash:
+            return self._contents[i]
+        return None
+
+    def __contains__(self, key_hash: int):
+        return self.get(key_hash) is not None
+
+    def match(self, key_hash: int, content_hash: int) -> str:
+        '''
+        'new', 'same' или 'changed' относительно индекса.
+        '''
+        old = self.get(key_hash)
+        if old is None:
+            return 'new'
+        return 'same' if old == content_hash else 'changed'
+
+    def keys(self) -> Iterable[int]:
+        yield from (key for key in self._keys if key not in self._added)
+        yield from self._added
+
+    def compact(self):
+        items = dict(zip(self._keys, self._contents))
+        items.update(self._added)
+        self._keys = array('Q', sorted(items))
+        self._contents = array('Q', (items[key] for key in self._keys))
+        self._added = {}
+
+    def save(self, path: str):
+        self.compact()
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self._header.pack(self._magic, len(self._keys)))
+            self._keys.tofile(f)
+            self._contents.tofile(f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'IdentityIndex':
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'rb') as f:
+            magic, count = cls._header.unpack(f.read(cls._header.size))
+            if magic != cls._magic:
+                raise ValueError(f'{path}: не индекс объектов')
+            keys, contents = array('Q'), array('Q')
+            keys.fromfile(f, count)
+            contents.fromfile(f, count)
+        return cls(keys, contents)
@@ -0,0 +1,47 @@
+'''
+Разбор больших json ответов по частям: элементы по пути prefix отдаются
+по одному, все дерево в памяти не строится. Нужен ijson, без него -
+json.loads и обход готового дерева (результат тот же).
+
+Путь в формате ijson: 'items.item' - элементы списка items,
+'block.item' - элементы списка block.
+'''
+import io
+import json
+
+from typing import Iterator
+
+
+def _ijson():
+    try:
+        import ijson
+    except ImportError:
+        return None
+    return ijson
+
+
+def _walk(node, path):
+    if not path:
+        yield node
+        return
+    key, rest = path[0], path[1:]
+    if key == 'item' and isinstance(node, list):
+        for item in node:
+            yield from _walk(item, rest)
+    elif isinstance(node, dict) and key in node:
+        yield from _walk(node[key], rest)
+
+
+def items(source, prefix: str) -> Iterator:
+    '''
+    source - bytes или файл (тело ответа, см. common.http.body_stream).
+    Числа - float/int, как у json.loads.
+    '''
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    ijson = _ijson()
+    if ijson:
+        yield from ijson.items(source, prefix, use_float=True)
+        return
+    # null вместо списка (как 'bulks': null) - пустой результат, как и у ijson
+    yield from _walk(json.load(source), prefix.split('.'))
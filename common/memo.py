@@ -0,0 +1,28 @@
+'''
+Нормализация повторяющихся строк. У всех квартир одного комплекса
+одинаковые сырые название комплекса, корпус, секция и очередь: результат
+считается один раз, а строка-результат одна на всех (sys.intern), а не
+новая у каждого объекта.
+'''
+import sys
+
+from functools import lru_cache, wraps
+
+# размер кэша на функцию в каждом процессе
+MAXSIZE = 4096
+
+
+def intern(value):
+    # sys.intern принимает только str, не подклассы (NavigableString у bs4)
+    return sys.intern(value) if type(value) is str else value
+
+
+def normalizer(func):
+    '''
+    Чистая функция нормализации с ограниченным кэшем (lru) и intern результата.
+    '''
+    @lru_cache(maxsize=MAXSIZE)
+    @wraps(func)
+    def cached(*args):
+        return intern(func(*args))
+    return cached
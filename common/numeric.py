@@ -0,0 +1,139 @@
+'''
+Числа в объектах: цены и площади.
+
+По умолчанию - Decimal, как всегда. В целочисленном режиме (--numeric int)
+цена хранится целыми рублями (Roubles), площадь - сотыми долями м²
+(Hundredths): это обычные int, сравнения и проверки цен идут без Decimal.
+Значение, которое так точно не представить (площадь с тремя знаками
+после точки, '1e6'), остается Decimal. При выводе (export) все
+переводится во float, поэтому результат в обоих режимах одинаковый.
+'''
+import math
+import re
+
+from decimal import Decimal
+
+MODES = ('decimal', 'int')
+MODE = 'decimal'
+
+_NUMBER = re.compile(r'([+-]?)(\d*)(?:\.(\d*))?')
+
+
+class Fixed(int):
+    '''
+    Целое число единиц 10**-scale.
+    '''
+    __slots__ = ()
+    scale = 0
+
+    def __float__(self):
+        return int(self) / 10 ** self.scale if self.scale else float(int(self))
+
+    def __truediv__(self, other):
+        # цена за метр: Roubles / Hundredths - в настоящих единицах
+        return float(self) / float(other)
+
+    def __rtruediv__(self, other):
+        return float(other) / float(self)
+
+    def text(self) -> str:
+        # как format(Decimal(...).normalize(), 'f'), для common.identity
+        whole, part = divmod(abs(int(self)), 10 ** self.scale)
+        text = str(whole)
+        if part:
+            text += '.' + str(part).rjust(self.scale, '0').rstrip('0')
+        return ('-' if self < 0 else '') + text
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.text()})'
+
+
+class Roubles(Fixed):
+    scale = 0
+
+
+class Hundredths(Fixed):
+    scale = 2
+
+
+def configure(mode: str):
+    global MODE
+    if mode not in MODES:
+        raise ValueError(f'неизвестный режим чисел: {mode}')
+    MODE = mode
+
+
+def _ratio(value):
+    '''
+    value как точная дробь (числитель, знаменатель) или None.
+    Отрицательный ноль - None: у Decimal он выводится как -0.0.
+    '''
+    if isinstance(value, int):
+        return value, 1
+    if isinstance(value, float):
+        if not math.isfinite(value) or _negative_zero(value):
+            return None
+        return value.as_integer_ratio()
+    if not isinstance(value, str):
+        return None
+    match = _NUMBER.fullmatch(value)
+    if not match or not (match.group(2) or match.group(3)):
+        return None
+    sign, whole, part = match.group(1), match.group(2), match.group(3) or ''
+    numerator = int(whole + part or '0')
+    if sign == '-' and not numerator:
+        return None
+    return (-numerator if sign == '-' else numerator), 10 ** len(part)
+
+
+def _negative_zero(value: float) -> bool:
+    return value == 0 and math.copysign(1, value) < 0
+
+
+def price(value, multi=1):
+    '''
+    round(Decimal(value) * multi, 0): в целочисленном режиме - Roubles
+    (округление к четному, как у Decimal).
+    '''
+    if MODE == 'int' and isinstance(multi, int):
+        ratio = _ratio(value)
+        if ratio:
+            quotient, remainder = divmod(ratio[0] * multi, ratio[1])
+            if 2 * remainder > ratio[1] or (2 * remainder == ratio[1] and quotient % 2):
+                quotient += 1
+            # -0.4 -> Decimal('-0'), в int такого нет
+            if quotient or ratio[0] >= 0:
+                return Roubles(quotient)
+    return round(Decimal(value) * multi, 0)
+
+
+def area(value):
+    '''
+    Decimal(value): в целочисленном режиме - Hundredths, если точно.
+    '''
+    if MODE == 'int':
+        if isinstance(value, float) and math.isfinite(value) and not _negative_zero(value):
+            # из json: 45.6 не точна в двоичном виде, но выводится так же
+            hundredths = round(value * 100)
+            if hundredths / 100 == value:
+                return Hundredths(hundredths)
+        ratio = _ratio(value)
+        if ratio:
+            hundredths, remainder = divmod(ratio[0] * 100, ratio[1])
+            if not remainder:
+                return Hundredths(hundredths)
+    return Decimal(value)
+
+
+def export(record: dict) -> dict:
+    '''
+    Fixed -> float для вывода, остальное без изменений.
+    '''
+    if not any(isinstance(value, Fixed) for value in record.values()):
+        return record
+    return {name: float(value) if isinstance(value, Fixed) else value
+            for name, value in record.items()}
+
+
+def export_all(records: list) -> list:
+    return [export(record) for record in records] if MODE == 'int' else records
@@ -0,0 +1,21 @@
+import json
+
+from common import numeric
+from common.stats import STATS
+
+
+def dump(records: list, args, cls=None, **kwargs):
+    '''
+    Вывод результата в stdout: весь список или, с --delta, только
+    изменения относительно прошлого запуска.
+    '''
+    with STATS.timer('json'):
+        records = numeric.export_all(records)
+        if getattr(args, 'delta', None):
+            from common.delta import delta
+
+            result = delta(records, args.delta, cls=cls)
+            for kind, items in result.items():
+                STATS.incr(f'delta:{kind}', len(items))
+            records = result
+        print(json.dumps(records, cls=cls, sort_keys=False, ensure_ascii=False, **kwargs))
@@ -0,0 +1,76 @@
+'''
+Адаптивный интервал между запросами к хосту (AIMD).
+
+Интервал Throttle - нижняя граница (политика сайта, например не чаще раза
+в 0.5сек), с нее и начинаем. Медленный ответ (дольше slow сек), 429, 5xx или
+ошибка соединения делят скорость к хосту на BACKOFF; каждый нормальный
+ответ прибавляет STEP от наибольшей скорости 1/граница (после любого
+замедления - обратно к границе не больше чем за 1/STEP ответов). Ответы сообщает
+common.http, ошибки соединения - Throttle.failed.
+'''
+import threading
+
+from typing import Optional
+
+from common.stats import STATS
+
+# доля наибольшей скорости за нормальный ответ
+STEP = 0.05
+BACKOFF = 2.0
+# не реже раза в 30 сек
+MIN_RATE = 1 / 30
+
+
+class Pacer:
+
+    def __init__(self):
+        self.enabled = False
+        self.slow = 5.0
+        self._lock = threading.Lock()
+        self._floors = {}
+        self._rates = {}
+
+    def open(self, slow: float = 5.0):
+        self.enabled = True
+        self.slow = slow
+
+    def interval(self, host: str, floor: float) -> float:
+        '''
+        Текущий интервал к host, не меньше floor.
+        '''
+        if not self.enabled or floor <= 0:
+            return floor
+        with self._lock:
+            self._floors[host] = floor
+            rate = self._rates.setdefault(host, 1 / floor)
+        return max(floor, 1 / rate)
+
+    def observe(self, host: str, elapsed: Optional[float] = None, status: Optional[int] = None):
+        '''
+        Ответ хоста; status=None - ответа нет (ошибка соединения, таймаут).
+        '''
+        if not self.enabled or host not in self._floors:
+            return
+        slow = status is None or status == 429 or status >= 500 or elapsed > self.slow
+        with self._lock:
+            top = 1 / self._floors[host]
+            rate = self._rates[host]
+            if slow:
+                rate = max(rate / BACKOFF, MIN_RATE)
+            else:
+                rate = min(rate + top * STEP, top)
+            self._rates[host] = rate
+        if slow:
+            STATS.incr(f'backoff:{host}')
+
+    def close(self):
+        '''
+        Итоговая скорость к каждому хосту - в STATS (pace:<host>, req/s).
+        '''
+        with self._lock:
+            for host, rate in self._rates.items():
+                STATS.gauge(f'pace:{host}', rate)
+        self.enabled = False
+
+
+PACER = Pacer()
@@ -0,0 +1,256 @@
+import gc
+import glob
+import os
+import pickle
+import time
+
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from common import numeric
+from common.html import release_trees
+from common.pipeline import Job
+from common.quarantine import QUARANTINE, Row, rule_of
+from common.stats import STATS, rss
+
+# заполняется в каждом процессе-обработчике при старте
+_handlers: Dict[str, Callable] = {}
+_finish: Optional[Callable] = None
+_profile_path: Optional[str] = None
+_profiler = None
+_in_worker = False
+# память процесса при старте: после fork в ней и память основного процесса
+_base_rss = 0.0
+# отброшенные объекты текущей пачки: (правило, ошибка, сырые данные, контекст)
+_rejected: list = []
+
+
+def _init_worker(handlers: Dict[str, Callable], finish: Optional[Callable],
+                 profile_path: Optional[str] = None, in_worker: bool = True,
+                 numeric_mode: str = 'decimal', gc_threshold: Optional[int] = None):
+    global _handlers, _finish, _profile_path, _profiler, _in_worker, _base_rss
+    _handlers = handlers
+    numeric.configure(numeric_mode)
+    if gc_threshold:
+        # деревья разбираются явно (release_trees), циклов остается мало:
+        # сборка поколения 0 реже, а загруженные модули вне сборки
+        gc.set_threshold(gc_threshold, *gc.get_threshold()[1:])
+        gc.freeze()
+    _finish = finish
+    _in_worker = in_worker
+    if in_worker:
+        # при fork процесс наследует счетчики основного, они уже посчитаны там
+        STATS.pop()
+        _base_rss = rss()
+    _profile_path = profile_path
+    _profiler = None
+    if profile_path:
+        import cProfile
+
+        _profiler = cProfile.Profile()
+
+
+def pack(records: list) -> bytes:
+    '''
+    Компактная форма для передачи между процессами:
+    у объектов одного типа одинаковые ключи, поэтому ключи пишем
+    один раз, а дальше только кортежи значений.
+    '''
+    groups = {}
+    for record in records:
+        if isinstance(record, dict):
+            groups.setdefault(tuple(record), []).append(tuple(record.values()))
+        else:
+            groups.setdefault(None, []).append(record)
+    return pickle.dumps(list(groups.items()), pickle.HIGHEST_PROTOCOL)
+
+
+def unpack(blob: bytes) -> Iterator:
+    for keys, rows in pickle.loads(blob):
+        if keys is None:
+            yield from rows
+        else:
+            for row in rows:
+                yield dict(zip(keys, row))
+
+
+def parse_one(name: str, raw: bytes, context: tuple) -> Tuple[List[Job], bytes]:
+    jobs, records = [], []
+    # setters (extract_*) и final_check считаются отдельно, в parse их не включаем
+    setters = STATS.timers['setters']
+    final_check = 0.0
+    start = time.perf_counter()
+    try:
+        for obj in _handlers[name](raw, *context):
+            if isinstance(obj, Job):
+                jobs.append(obj)
+                continue
+            row = obj if isinstance(obj, Row) else None
+            try:
+                if row:
+                    obj = row.extract(*row.args)
+                if obj is None:
+                    STATS.incr('rejected:skipped')
+                    continue
+                if _finish:
+                    check_start = time.perf_counter()
+                    try:
+                        obj = _finish(obj)
+                    finally:
+                        final_check += time.perf_counter() - check_start
+            except Exception as e:
+                if row:
+                    data, where = row.raw_data(), row.context()
+                else:
+                    data, where = getattr(obj, '__dict__', obj), context
+                _rejected.append((rule_of(e), str(e), data, where))
+                continue
+            records.append(obj)
+    finally:
+        # объекты уже словари, деревья страницы больше не нужны
+        release_trees()
+    elapsed = time.perf_counter() - start
+    STATS.add_time('final_check', final_check)
+    STATS.add_time('parse', elapsed - final_check - (STATS.timers['setters'] - setters))
+    with STATS.timer('pack'):
+        blob = pack(records)
+    return jobs, blob
+
+
+def parse_chunk(tasks: List[Tuple[str, bytes, tuple]]) -> Tuple[list, Optional[dict], list]:
+    '''
+    Разбирает пачку страниц. Ошибка одной страницы не мешает остальным,
+    она возвращается вместо результата.
+    Вместе с результатами отдает отброшенные объекты и (в процессе-обработчике)
+    свою статистику за пачку.
+    '''
+    results = []
+    if _profiler:
+        _profiler.enable()
+    for name, raw, context in tasks:
+        try:
+            results.append(parse_one(name, raw, context))
+        except Exception as e:
+            results.append(e)
+    if _profiler:
+        _profiler.disable()
+        _profiler.dump_stats(f'{_profile_path}.{os.getpid()}')
+    # сколько процесс занял сам, сверх унаследованного от основного
+    STATS.gauge('maxrss:parse', max(rss() - _base_rss, 0.0))
+    rejected = _rejected[:]
+    _rejected.clear()
+    return results, STATS.pop() if _in_worker else None, rejected
+
+
+class ParsePool:
+    '''
+    Пул процессов для разбора страниц.
+    Получает сырые байты ответа и имя обработчика, возвращает новые Job
+    и готовые (проверенные через finish) объекты в упакованном виде.
+    workers=0 - разбор в текущем процессе (удобно для отладки).
+
+    Память процессов ограничивается заменой пула: после max_tasks пачек
+    на процесс или когда процесс превысил max_rss МБ создается новый
+    пул, старый доделывает свои пачки и завершается. Память процесса -
+    сверх занятой при старте (после fork это память основного процесса),
+    результаты пачек старых пулов на замену не влияют. (max_tasks_per_child
+    у ProcessPoolExecutor требует spawn, а обработчики парсеров в
+    процессе, запущенном через spawn, не найти: см. common.sites.)
+    '''
+
+    unpack = staticmethod(unpack)
+
+    def __init__(self, handlers: Dict[str, Callable], finish: Optional[Callable] = None,
+                 workers: Optional[int] = None, chunk_size: int = 1,
+                 profile: Optional[str] = None, gc_threshold: Optional[int] = None,
+                 max_tasks: Optional[int] = None, max_rss: Optional[float] = None):
+        self.handlers = handlers
+        self.finish = finish
+        self.workers = os.cpu_count() if workers is None else workers
+        self.chunk_size = max(chunk_size, 1)
+        self.profile = profile
+        self.gc_threshold = gc_threshold
+        self.max_tasks = max_tasks
+        self.max_rss = max_rss
+        self._executor = None
+        self._generation = 0
+        self._submitted = 0
+        self._over_rss = False
+
+    @classmethod
+    def from_args(cls, handlers: Dict[str, Callable], finish: Optional[Callable], args):
+        return cls(handlers, finish, workers=args.workers, chunk_size=args.chunk_size,
+                   profile=args.profile, gc_threshold=args.gc_threshold,
+                   max_tasks=args.max_tasks_per_child, max_rss=args.max_rss)
+
+    def start(self):
+        if self.workers:
+            self._executor = self._new_executor()
+        else:
+            _init_worker(self.handlers, self.finish, self.profile, in_worker=False,
+                         numeric_mode=numeric.MODE, gc_threshold=self.gc_threshold)
+
+    def _new_executor(self):
+        # multiprocessing грузим, только если пул действительно нужен
+        import multiprocessing
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        initargs = (self.handlers, self.finish, self.profile, True, numeric.MODE, self.gc_threshold)
+        self._generation += 1
+        self._submitted = 0
+        self._over_rss = False
+        # обработчики парсеров из модулей sites_<сайт> (common.sites), которые
+        # в процессе, запущенном через spawn/forkserver, не импортировать
+        context = None
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        return ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_worker,
+                                   initargs=initargs)
+
+    def submit(self, tasks: List[Tuple[str, bytes, tuple]]):
+        if self._executor:
+            if self._over_rss or (self.max_tasks and self._submitted >= self.max_tasks * self.workers):
+                # старый пул доделывает отправленные пачки и завершается
+                self._executor.shutdown(wait=False)
+                self._executor = self._new_executor()
+                STATS.incr('pool:recycled')
+            self._submitted += 1
+            future = self._executor.submit(parse_chunk, tasks)
+            future.generation = self._generation
+            return future
+        from concurrent.futures import Future
+
+        future = Future()
+        future.set_result(parse_chunk(tasks))
+        return future
+
+    def result(self, future) -> list:
+        results, stats, rejected = future.result()
+        if stats:
+            STATS.merge(stats)
+            # пачка уже замененного пула: его процессы и так завершаются
+            current = getattr(future, 'generation', None) == self._generation
+            if self.max_rss and current and stats['gauges'].get('maxrss:parse', 0) > self.max_rss:
+                self._over_rss = True
+        for rule, error, raw, context in rejected:
+            QUARANTINE.add(rule, error, raw, context)
+        return results
+
+    def shutdown(self, wait: bool = True):
+        if self._executor:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+        if self.profile:
+            self._merge_profiles()
+
+    def _merge_profiles(self):
+        # каждый процесс пишет свой файл, собираем их в один
+        parts = glob.glob(glob.escape(self.profile) + '.*')
+        parts = [part for part in parts if part[len(self.profile) + 1:].isdigit()]
+        if not parts:
+            return
+        import pstats
+
+        pstats.Stats(*parts).dump_stats(self.profile)
+        for part in parts:
+            os.remove(part)
@@ -0,0 +1,372 @@
+import collections
+import itertools
+import queue
+import sys
+import threading
+import time
+
+from concurrent.futures import BrokenExecutor
+from urllib.parse import urldefrag, urlsplit
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from common.http import no_response
+from common.pacing import PACER
+from common.schedule import SCHEDULE
+from common.stats import STATS
+
+
+class Job(NamedTuple):
+    '''
+    Задание на загрузку одной страницы.
+    handler - имя обработчика из словаря handlers, context - его доп. аргументы.
+    unit - url комплекса (Pipeline(recrawl=...)), из которого выросло задание.
+    '''
+    url: str
+    handler: str
+    context: tuple = ()
+    depth: int = 0
+    unit: Optional[str] = None
+
+
+class Throttle:
+    '''
+    Обеспечивает минимальный интервал между запросами
+    (по инструкции 0.5сек). Можно делить между потоками.
+    При ответах из сохраненного набора страниц паузы не нужны (enabled).
+    С ledger (common.ratelimit) интервал к хосту общий для всех процессов,
+    для этого wait нужен url запроса. С PACER (common.pacing) interval -
+    нижняя граница, интервал к хосту растет при медленных ответах и ошибках.
+    '''
+
+    enabled = True
+    ledger = None
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last = 0.0
+
+    def wait(self, url: Optional[str] = None, min_interval: float = 0.0):
+        '''
+        min_interval - интервал для этого запроса, если он больше обычного
+        (один Throttle на хост, а не второй со своим интервалом).
+        '''
+        if not Throttle.enabled:
+            return
+        host = urlsplit(url).hostname if url else None
+        interval = PACER.interval(host, self.interval) if host else self.interval
+        interval = max(interval, min_interval)
+        if Throttle.ledger and host:
+            delay = Throttle.ledger.reserve(host, interval)
+            if delay > 0:
+                with STATS.timer('sleep'):
+                    time.sleep(delay)
+            return
+        with self._lock:
+            delay = self._last + interval - time.monotonic()
+            if delay > 0:
+                with STATS.timer('sleep'):
+                    time.sleep(delay)
+            self._last = time.monotonic()
+
+    def failed(self, url: str, error: Exception):
+        # только запрос без ответа (таймаут, обрыв соединения): ответ с ошибкой
+        # уже учтен в common.http._observe, ошибка разбора - не вина хоста
+        if Throttle.enabled and no_response(error):
+            PACER.observe(urlsplit(url).hostname)
+
+
+class Pipeline:
+    '''
+    Конвейер fetch -> parse -> emit.
+
+    fetch - один поток, соблюдает интервал между запросами; с lanes=True
+    по потоку (и своему интервалу) на каждый хост, поддомены грузятся
+    параллельно с основным сайтом;
+    parse - пул процессов common.parse_pool.ParsePool (html5lib не упирается
+    в GIL и идет параллельно с паузами между запросами);
+    emit - вызывающий поток, получает готовые объекты.
+
+    Стадии связаны ограниченными очередями, поэтому быстрая стадия
+    ждет медленную, а не копит страницы в памяти.
+    Обработчик - генератор, который отдает объекты и новые Job.
+
+    prefetch - обработчики страниц списка: такие страницы грузятся вне
+    очереди, пока обходятся комплексы с текущей; открыто не больше
+    lookahead страниц списка, включая обходимую (страница открыта, пока
+    не обработаны все задания, которые из нее выросли). Задания из более
+    ранней страницы идут раньше, первыми - выросшие из начальных заданий
+    (комплексы первой страницы).
+
+    recrawl - обработчики страниц комплексов: с --schedule комплекс
+    обходится, только если подошел его срок (common.schedule), объекты
+    остальных отдаются в emit из прошлого обхода после конвейера.
+    Если обработчик отдает не готовые объекты, а сырые данные (PIK), emit
+    возвращает список готовых объектов: расписание хранит их, а не сырые
+    данные, и объекты прошлого обхода отдаются в carried, а не в emit.
+    '''
+
+    _STOP = object()
+    # группа начальных заданий: открытая страница списка, как и остальные
+    _INITIAL = -1
+
+    def __init__(self, fetch: Callable[[str], bytes], pool, emit: Callable,
+                 throttle: Optional[Throttle] = None, queue_size: int = 16,
+                 on_error: Optional[Callable[[Exception, Optional[Job]], None]] = None,
+                 dedup_urls: bool = False, lanes: bool = False,
+                 prefetch: Iterable[str] = (), lookahead: int = 2,
+                 recrawl: Iterable[str] = (), carried: Optional[Callable] = None):
+        self.fetch = fetch
+        self.pool = pool
+        self.emit = emit
+        self.throttle = throttle
+        self.queue_size = queue_size
+        self.on_error = on_error
+        # не загружать одну и ту же страницу дважды (ссылки на нее с разных страниц)
+        self.dedup_urls = dedup_urls
+        self.lanes = lanes
+        self.prefetch = frozenset(prefetch)
+        self.lookahead = lookahead
+        self.recrawl = frozenset(recrawl)
+        self.carried = carried or emit
+
+    def run(self, jobs: Iterable[Job]):
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._error = None
+        self._seen_urls = set()
+        self._lanes = {}
+        # хост -> [первое задание, последний ответ], для скорости полос
+        self._spans = {}
+        # открытые страницы списка: группа -> заданий в работе, и ждущие очереди
+        self._open = {}
+        self._waiting = collections.deque()
+        self._pages = queue.Queue(maxsize=self.queue_size)
+        self._parsed = queue.Queue(maxsize=max(self.pool.workers, 1) * 2)
+        self._results = queue.Queue(maxsize=self.queue_size)
+
+        # группа открыта, пока начальные задания ставятся в очередь
+        self._open[self._INITIAL] = 1
+        for job in jobs:
+            self._submit(job, self._INITIAL)
+        with self._lock:
+            self._release(self._INITIAL)
+        if not self._pending:
+            self._emit_carried()
+            return
+
+        self.pool.start()
+        threads = [
+            threading.Thread(target=self._parse_stage, daemon=True),
+            threading.Thread(target=self._collect_stage, daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            self._emit_stage()
+        finally:
+            self.pool.shutdown(wait=self._error is None)
+            for host, (started, last) in self._spans.items():
+                STATS.add_time(f'lane:{host}', last - started)
+        if self._error:
+            raise self._error
+        self._emit_carried()
+
+    def _emit_carried(self):
+        for obj in SCHEDULE.carried():
+            STATS.incr('schedule:objects')
+            with STATS.timer('emit'):
+                self.carried(obj)
+
+    def _submit(self, job: Job, group: Optional[int] = None):
+        with self._lock:
+            if self.dedup_urls:
+                url = urldefrag(job.url)[0]
+                if url in self._seen_urls:
+                    STATS.incr('dedup:urls')
+                    return
+                self._seen_urls.add(url)
+            if job.handler in self.recrawl and SCHEDULE.enabled:
+                # срок и --budget проверяются перед загрузкой (_fetch_stage):
+                # задания часто ставятся в очередь все сразу
+                job = job._replace(unit=job.url)
+            self._pending += 1
+            if job.handler in self.prefetch:
+                self._waiting.append((job, next(self._seq)))
+                self._promote()
+                return
+            if group in self._open:
+                self._open[group] += 1
+            # страницы списка по порядку, внутри страницы - сначала вглубь,
+            # как во вложенных циклах: глубокие задания первыми
+            self._put(job, (-1 if group is None else group, -job.depth), group)
+
+    def _put(self, job: Job, priority: tuple, group: Optional[int]):
+        # вызывается под self._lock
+        jobs = self._lane(urlsplit(job.url).hostname if self.lanes else None)
+        jobs.put((priority, next(self._seq), job, group))
+
+    def _promote(self):
+        # вызывается под self._lock: страницы списка вне очереди, пока есть место
+        while self._waiting and len(self._open) < self.lookahead:
+            job, group = self._waiting.popleft()
+            self._open[group] = 1
+            STATS.incr('prefetch:pages')
+            self._put(job, (-sys.maxsize, 0), group)
+
+    def _lane(self, host: Optional[str]) -> queue.PriorityQueue:
+        # вызывается под self._lock
+        if host not in self._lanes:
+            throttle = self.throttle
+            if throttle and self.lanes:
+                throttle = Throttle(throttle.interval)
+            self._lanes[host] = queue.PriorityQueue()
+            threading.Thread(target=self._fetch_stage, args=(self._lanes[host], throttle, host),
+                             daemon=True).start()
+        return self._lanes[host]
+
+    def _release(self, group: Optional[int]):
+        # вызывается под self._lock: задание группы закончено
+        if group in self._open:
+            self._open[group] -= 1
+            if not self._open[group]:
+                del self._open[group]
+                self._promote()
+
+    def _done(self, group: Optional[int] = None):
+        with self._lock:
+            self._pending -= 1
+            finished = self._pending == 0
+            self._release(group)
+        if finished:
+            for jobs in self._lanes.values():
+                jobs.put(((float('-inf'),), -1, self._STOP, None))
+            self._pages.put(self._STOP)
+            self._parsed.put(self._STOP)
+            self._results.put(self._STOP)
+
+    def _fail(self, error: Exception, job: Optional[Job] = None) -> bool:
+        '''
+        Возвращает True, если ошибку обработали и можно продолжать.
+        '''
+        if job and job.unit:
+            SCHEDULE.failed(job.unit)
+        if self.on_error:
+            self.on_error(error, job)
+            return True
+        self._abort(error)
+        return False
+
+    def _abort(self, error: Exception):
+        # остановка всего конвейера, on_error не вызывается
+        with self._lock:
+            if self._error is not None:
+                return
+            self._error = error
+        # разбудить emit, если он ждет; из самого emit (или при полной
+        # очереди) put блокировал бы навсегда - emit и так проверяет _error
+        try:
+            self._results.put_nowait(self._STOP)
+        except queue.Full:
+            pass
+        return False
+
+    def _fetch_stage(self, jobs: queue.PriorityQueue, throttle: Optional[Throttle],
+                     host: Optional[str]):
+        while True:
+            job, group = jobs.get()[2:]
+            if job is self._STOP or self._error:
+                return
+            if job.handler in self.recrawl and job.unit == job.url and not SCHEDULE.claim(job.url):
+                # объекты комплекса - из прошлого обхода (SCHEDULE.carried)
+                self._done(group)
+                continue
+            if host and host not in self._spans:
+                self._spans[host] = [time.monotonic()] * 2
+            if throttle:
+                throttle.wait(job.url)
+            try:
+                with STATS.timer('fetch'):
+                    payload = self.fetch(job.url)
+                STATS.incr('requests')
+                STATS.incr('bytes', len(payload))
+                if host:
+                    STATS.incr(f'lane_requests:{host}')
+            except Exception as e:
+                if throttle:
+                    throttle.failed(job.url, e)
+                if self._fail(e, job):
+                    self._done(group)
+                    continue
+                return
+            finally:
+                if host:
+                    self._spans[host][1] = time.monotonic()
+            self._pages.put((job, group, payload))
+
+    def _parse_stage(self):
+        while True:
+            item = self._pages.get()
+            if item is self._STOP or self._error:
+                return
+            # набираем пачку из того, что уже загружено, но не ждем полную
+            chunk = [item]
+            while len(chunk) < self.pool.chunk_size:
+                try:
+                    item = self._pages.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    self._pages.put(item)
+                    break
+                chunk.append(item)
+            jobs = [(job, group) for job, group, payload in chunk]
+            tasks = [(job.handler, payload, job.context) for job, group, payload in chunk]
+            self._parsed.put((jobs, self.pool.submit(tasks)))
+
+    def _collect_stage(self):
+        while True:
+            item = self._parsed.get()
+            if item is self._STOP or self._error:
+                return
+            jobs, future = item
+            try:
+                results = self.pool.result(future)
+            except BrokenExecutor as e:
+                # процессы пула умерли: следующие страницы тоже не разобрать,
+                # это ошибка запуска, а не страниц
+                self._abort(e)
+                return
+            except Exception as e:
+                results = [e] * len(jobs)
+            for (job, group), result in zip(jobs, results):
+                if isinstance(result, Exception):
+                    if self._fail(result, job):
+                        self._done(group)
+                        continue
+                    return
+                new_jobs, blob = result
+                for new_job in new_jobs:
+                    self._submit(new_job._replace(depth=job.depth + 1, unit=job.unit), group)
+                for obj in self.pool.unpack(blob):
+                    self._results.put((obj, job.unit))
+                self._done(group)
+
+    def _emit_stage(self):
+        while True:
+            item = self._results.get()
+            if item is self._STOP or self._error:
+                return
+            obj, unit = item
+            try:
+                with STATS.timer('emit'):
+                    records = self.emit(obj)
+                if unit:
+                    for record in (obj,) if records is None else records:
+                        SCHEDULE.record(unit, record)
+            except Exception as e:
+                if unit:
+                    SCHEDULE.failed(unit)
+                if not self._fail(e):
+                    return
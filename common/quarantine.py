@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+import threading
+
+from typing import Callable, NamedTuple, Optional
+
+from common.stats import STATS
+
+
+class Rejected(Exception):
+    '''
+    Объект не прошел проверку. rule - короткое имя правила для отчета.
+    '''
+
+    def __init__(self, rule: str, *args):
+        super().__init__(*args)
+        self.rule = rule
+
+
+def rule_of(error: Exception) -> str:
+    if isinstance(error, Rejected):
+        return error.rule
+    # неожиданные ошибки разбора строки (IndexError в set_floor и т.п.)
+    return type(error).__name__
+
+
+class Row(NamedTuple):
+    '''
+    Отложенный вызов extract_*: обработчик отдает Row, а сам вызов идет
+    в parse_pool под try, чтобы плохая строка не обрывала всю страницу.
+    raw - что сохранить в карантин, по умолчанию первый аргумент.
+    '''
+    extract: Callable
+    args: tuple
+    raw: object = None
+
+    def raw_data(self):
+        raw = self.args[0] if self.raw is None else self.raw
+        # у тегов bs4 сохраняем html строки
+        return str(raw) if hasattr(raw, 'attrs') else raw
+
+    def context(self):
+        # остальные аргументы: название комплекса, корпус и т.п.
+        raw = self.args[0] if self.raw is None else self.raw
+        return [arg for arg in self.args if arg is not raw]
+
+
+class Quarantine:
+    '''
+    Отброшенные объекты: счетчики по правилам (в STATS как rejected:<правило>)
+    и, если задан файл, сами сырые строки в формате jsonl.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self.path = None
+        self.count = 0
+
+    def open(self, path: Optional[str]):
+        if path:
+            self.path = path
+            self._file = open(path, 'a', encoding='utf-8')
+
+    def add(self, rule: str, error, raw=None, context=None):
+        STATS.incr(f'rejected:{rule}')
+        with self._lock:
+            self.count += 1
+            if self._file:
+                entry = {'rule': rule, 'error': str(error), 'raw': raw, 'context': context}
+                self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+
+    def add_error(self, error: Exception, raw=None, context=None):
+        self.add(rule_of(error), error, raw, context)
+
+    def page_error(self, error: Exception, job=None):
+        # ошибка разбора страницы целиком, например поменялась верстка
+        self.add('page:' + rule_of(error), error, job and job.url, job and job.context)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+        if self.count:
+            where = f', см. {self.path}' if self.path else ''
+            print(f'в карантине {self.count} объектов{where}', file=sys.stderr)
+
+
+QUARANTINE = Quarantine()
+
+if hasattr(os, 'register_at_fork'):
+    # как у STATS: замок, занятый другим потоком в момент fork
+    os.register_at_fork(after_in_child=lambda: setattr(QUARANTINE, '_lock', threading.Lock()))
@@ -0,0 +1,50 @@
+'''
+Общий для всех процессов интервал между запросами к одному хосту.
+
+Throttle соблюдает интервал только внутри процесса. Если запущено
+несколько парсеров сразу (пересекающиеся задания cron, процессы одного
+запуска), они договариваются через файл SQLite: для каждого хоста
+хранится время, раньше которого следующий запрос делать нельзя.
+Процесс в транзакции занимает ближайшее свободное время и спит уже
+после нее, поэтому файл не заблокирован на время паузы.
+'''
+import sqlite3
+import threading
+import time
+
+# если часы перевели назад, не ждать дольше этого
+MAX_AHEAD = 60.0
+
+
+class Ledger:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS hosts (host TEXT PRIMARY KEY, next REAL NOT NULL)')
+
+    def reserve(self, host: str, interval: float) -> float:
+        '''
+        Занимает время для запроса к host, возвращает сколько ждать (сек).
+        '''
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                row = self._db.execute('SELECT next FROM hosts WHERE host = ?', (host,)).fetchone()
+                slot = now
+                if row and now < row[0] < now + MAX_AHEAD:
+                    slot = row[0]
+                self._db.execute('INSERT OR REPLACE INTO hosts (host, next) VALUES (?, ?)',
+                                 (host, slot + interval))
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        return slot - now
+
+    def close(self):
+        self._db.close()
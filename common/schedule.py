@@ -0,0 +1,162 @@
+'''
+Обход комплексов по частоте их изменений (--schedule PATH, SQLite).
+
+Комплекс (задание обработчика из Pipeline(recrawl=...), ключ - его url)
+обходится, только если подошел его срок. Срок - по изменениям в прошлых
+запусках: скорость изменений (изменений + 1) / (наблюдалось сек + PRIOR),
+интервал - обратная величина в пределах MIN_INTERVAL..MAX_INTERVAL.
+Изменение - другой набор объектов комплекса (сумма хэшей содержимого).
+С --budget SEC после SEC сек от начала запуска новые комплексы не
+начинаются и остаются должниками до следующего запуска.
+
+Необойденные комплексы не пропадают из вывода: их объекты из прошлого
+обхода отдаются в emit после конвейера (см. Pipeline.run), так --delta и
+--db не считают их снятыми с продажи.
+'''
+import json
+import sqlite3
+import threading
+import time
+
+from typing import Optional
+
+from common import numeric
+from common.identity import fingerprint
+from common.stats import STATS
+
+# как будто одно изменение в сутки до первых наблюдений
+PRIOR = 24 * 3600.0
+MIN_INTERVAL = 3600.0
+MAX_INTERVAL = 14 * 24 * 3600.0
+# срок подошел, если до него меньше этой доли интервала (запуски по cron
+# не ровно через сутки)
+SLACK = 0.1
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS complexes (
+    site TEXT NOT NULL,
+    url TEXT NOT NULL,
+    visits INTEGER NOT NULL,
+    changes INTEGER NOT NULL,
+    observed REAL NOT NULL,
+    interval REAL NOT NULL,
+    last_crawl REAL NOT NULL,
+    next_due REAL NOT NULL,
+    digest INTEGER NOT NULL,
+    records TEXT NOT NULL,
+    PRIMARY KEY (site, url)
+)
+'''
+
+
+def _signed(value: int) -> int:
+    # INTEGER в SQLite - знаковые 64 бита
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def interval(changes: int, observed: float) -> float:
+    rate = (changes + 1) / (observed + PRIOR)
+    return min(max(1 / rate, MIN_INTERVAL), MAX_INTERVAL)
+
+
+class Schedule:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._db = None
+        self._known = {}
+        self._crawled = {}
+        self._failed = set()
+        self._carried = []
+
+    @property
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    def open(self, path: Optional[str], site: str, budget: Optional[float] = None):
+        if not path:
+            return
+        self.site = site
+        self.budget = budget
+        self.started = time.time()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(SCHEMA)
+        rows = self._db.execute('SELECT url, visits, changes, observed, last_crawl, next_due, digest, records '
+                                'FROM complexes WHERE site = ?', (site,))
+        self._known = {row[0]: row[1:] for row in rows}
+
+    def claim(self, url: str) -> bool:
+        '''
+        True - обходить комплекс в этом запуске, иначе его объекты из
+        прошлого обхода будут отданы в carried().
+        '''
+        with self._lock:
+            if url in self._crawled:
+                return True
+            known = self._known.get(url)
+            now = time.time()
+            if known:
+                next_due, last_crawl = known[4], known[3]
+                if next_due - now > SLACK * (next_due - last_crawl):
+                    STATS.incr('schedule:skipped')
+                    self._carried.append(url)
+                    return False
+            if self.budget is not None and now - self.started > self.budget:
+                STATS.incr('schedule:carried')
+                self._carried.append(url)
+                return False
+            STATS.incr('schedule:due')
+            self._crawled[url] = [0, []]
+            return True
+
+    def record(self, url: str, record: dict):
+        record = numeric.export(record)
+        content = fingerprint(record)[1]
+        with self._lock:
+            state = self._crawled[url]
+            state[0] = (state[0] + content) & ((1 << 64) - 1)
+            state[1].append(record)
+
+    def failed(self, url: str):
+        # объекты комплекса получены не все: не сравнивать и не сохранять
+        with self._lock:
+            self._failed.add(url)
+
+    def carried(self):
+        '''
+        Объекты необойденных комплексов из прошлого обхода.
+        '''
+        for url in self._carried:
+            known = self._known.get(url)
+            if known:
+                yield from json.loads(known[6])
+
+    def close(self):
+        with self._lock:
+            if self._db is None:
+                return
+            now = time.time()
+            rows = []
+            for url, (digest, records) in self._crawled.items():
+                if url in self._failed:
+                    continue
+                visits, changes, observed = 1, 0, 0.0
+                known = self._known.get(url)
+                if known:
+                    changed = _signed(digest) != known[5]
+                    visits, changes = known[0] + 1, known[1] + changed
+                    observed = known[2] + now - known[3]
+                    STATS.incr('schedule:changed' if changed else 'schedule:unchanged')
+                wait = interval(changes, observed)
+                rows.append((self.site, url, visits, changes, observed, wait, now, now + wait,
+                             _signed(digest), json.dumps(records, ensure_ascii=False, default=float)))
+            with STATS.timer('db'), self._db:
+                self._db.executemany('INSERT OR REPLACE INTO complexes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._db.close()
+            self._db = None
+            # следующий запуск в том же процессе (тесты) начинает с чистого листа
+            self._known, self._crawled, self._failed, self._carried = {}, {}, set(), []
+
+
+SCHEDULE = Schedule()
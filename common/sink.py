@@ -0,0 +1,176 @@
+'''
+Локальная база объектов (SQLite, --db PATH) в дополнение к json в stdout.
+
+units - последнее состояние каждого объекта (ключ - common.identity),
+first_seen/last_seen - когда объект впервые и последний раз был на сайте;
+history - цены и наличие на момент каждого изменения объекта.
+Ключ объекта включает сайт. Одинаковые объекты (ключ без номера) получают
+номера вхождения по хэшу содержимого, а не по порядку загрузки: объекты
+собираются во временной таблице и пишутся в close(), пачками по --db-batch,
+одна транзакция на пачку.
+
+    SELECT complex, count(*) FROM units
+    WHERE site = 'azbuka' AND last_seen = (SELECT max(last_seen) FROM units WHERE site = 'azbuka')
+    GROUP BY complex;
+'''
+import json
+import sqlite3
+import threading
+
+from datetime import datetime, timezone
+from typing import Optional
+
+from common import numeric
+from common.identity import fingerprint, numbered, site_key
+from common.stats import STATS
+
+PRICES = ('price_base', 'price_sale', 'price_finished', 'price_finished_sale')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS units (
+    key INTEGER PRIMARY KEY,
+    site TEXT NOT NULL,
+    complex TEXT, building TEXT, section TEXT, number TEXT, type TEXT,
+    price_base REAL, price_sale REAL, price_finished REAL, price_finished_sale REAL,
+    area REAL, in_sale INTEGER,
+    content INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS units_complex ON units (site, complex);
+CREATE INDEX IF NOT EXISTS units_last_seen ON units (site, last_seen);
+CREATE TABLE IF NOT EXISTS history (
+    key INTEGER NOT NULL,
+    seen TEXT NOT NULL,
+    price_base REAL, price_sale REAL, price_finished REAL, price_finished_sale REAL,
+    in_sale INTEGER
+);
+CREATE INDEX IF NOT EXISTS history_key ON history (key, seen);
+'''
+
+# поля объекта в units без site и дат (у всех объектов запуска одинаковые)
+COLUMNS = ('key', 'complex', 'building', 'section', 'number', 'type') + PRICES + (
+    'area', 'in_sale', 'content', 'record')
+
+STAGE = f'''
+CREATE TEMP TABLE IF NOT EXISTS staged ({', '.join(COLUMNS)});
+CREATE INDEX IF NOT EXISTS temp.staged_key ON staged (key, content, record);
+'''
+
+INSERT_STAGED = f'INSERT INTO staged VALUES ({", ".join(":" + name for name in COLUMNS)})'
+# одинаковые ключи подряд, внутри - по содержимому: номер вхождения не зависит
+# от того, в каком порядке объекты пришли из конвейера
+SELECT_STAGED = f'SELECT {", ".join(COLUMNS)} FROM staged ORDER BY key, content, record'
+
+# история пишется до обновления units: только если объекта не было или он изменился
+INSERT_HISTORY = '''
+INSERT INTO history (key, seen, price_base, price_sale, price_finished, price_finished_sale, in_sale)
+SELECT :key, :seen, :price_base, :price_sale, :price_finished, :price_finished_sale, :in_sale
+WHERE NOT EXISTS (SELECT 1 FROM units WHERE key = :key AND content = :content)
+'''
+
+UPSERT_UNIT = '''
+INSERT INTO units (key, site, complex, building, section, number, type,
+                   price_base, price_sale, price_finished, price_finished_sale,
+                   area, in_sale, content, record, first_seen, last_seen)
+VALUES (:key, :site, :complex, :building, :section, :number, :type,
+        :price_base, :price_sale, :price_finished, :price_finished_sale,
+        :area, :in_sale, :content, :record, :seen, :seen)
+ON CONFLICT (key) DO UPDATE SET
+    price_base = excluded.price_base, price_sale = excluded.price_sale,
+    price_finished = excluded.price_finished, price_finished_sale = excluded.price_finished_sale,
+    area = excluded.area, in_sale = excluded.in_sale,
+    content = excluded.content, record = excluded.record, last_seen = excluded.last_seen
+'''
+
+
+def _signed(value: int) -> int:
+    # INTEGER в SQLite - знаковые 64 бита
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _real(value):
+    return None if value is None else float(value)
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+class Sink:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._db = None
+        self._rows = []
+
+    def open(self, path: Optional[str], site: str, batch_size: int = 1000):
+        if not path:
+            return
+        self.site = site
+        self.batch_size = batch_size
+        # время запуска: у всех объектов одного запуска одинаковый last_seen
+        self.seen = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        self._db.executescript(STAGE)
+
+    def add(self, record: dict):
+        if self._db is None:
+            return
+        record = numeric.export(record)
+        key_hash, content_hash = fingerprint(record)
+        with self._lock:
+            row = {name: _real(record.get(name)) for name in PRICES}
+            row.update(
+                key=_signed(site_key(self.site, key_hash)),
+                complex=record.get('complex'), building=_text(record.get('building')),
+                section=_text(record.get('section')), number=_text(record.get('number')),
+                type=record.get('type'), area=_real(record.get('area')),
+                in_sale=record.get('in_sale'), content=_signed(content_hash),
+                record=json.dumps(record, ensure_ascii=False, default=float),
+            )
+            self._rows.append(row)
+            if len(self._rows) >= self.batch_size:
+                self._stage()
+
+    def _stage(self):
+        if not self._rows:
+            return
+        with STATS.timer('db'), self._db:
+            self._db.executemany(INSERT_STAGED, self._rows)
+        self._rows = []
+
+    def _write(self, rows: list):
+        with STATS.timer('db'), self._db:
+            self._db.executemany(INSERT_HISTORY, rows)
+            self._db.executemany(UPSERT_UNIT, rows)
+        STATS.incr('db:rows', len(rows))
+
+    def _flush(self):
+        self._stage()
+        # отдельный курсор: чтение staged идет, пока пачки пишутся в units
+        staged = self._db.cursor().execute(SELECT_STAGED)
+        rows = []
+        for key_hash, values in numbered((values[0] & ((1 << 64) - 1), values) for values in staged):
+            row = dict(zip(COLUMNS, values), site=self.site, seen=self.seen)
+            row['key'] = _signed(key_hash)
+            rows.append(row)
+            if len(rows) >= self.batch_size:
+                self._write(rows)
+                rows = []
+        if rows:
+            self._write(rows)
+
+    def close(self):
+        with self._lock:
+            if self._db is None:
+                return
+            self._flush()
+            self._db.close()
+            self._db = None
+
+
+SINK = Sink()
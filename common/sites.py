@@ -0,0 +1,41 @@
+import importlib.util
+import os
+import sys
+
+from types import ModuleType
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# сайт -> (файл парсера, функция запуска)
+SITES = {
+    'abscity': ('abscity_ru.py', 'price'),
+    'ama': ('ama_ru.py', 'price'),
+    'azbuka': ('azbuka-ru-v2.0.py', 'price'),
+    'pik': ('pik_v2.0.py', 'main'),
+}
+
+
+def load_site(name: str) -> ModuleType:
+    '''
+    Загружает парсер одного сайта. Имена файлов не годятся для import
+    (дефисы, точки), поэтому грузим по пути под именем сайта.
+    '''
+    module_name = f'sites_{name}'
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    path = os.path.join(ROOT, SITES[name][0])
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    # до выполнения, чтобы pickle находил обработчики для пула процессов
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
+
+
+def run_site(name: str, args):
+    module = load_site(name)
+    getattr(module, SITES[name][1])(args)
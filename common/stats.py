@@ -0,0 +1,188 @@
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # не Unix
+    resource = None
+
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+
+# метка для 'имя:значение' в формате Prometheus, по умолчанию kind
+LABELS = {
+    'rejected': 'reason',
+    'backoff': 'host',
+    'lane': 'host',
+    'lane_requests': 'host',
+    'pace': 'host',
+    'maxrss': 'process',
+}
+
+
+class Stats:
+    '''
+    Таймеры стадий (сек), счетчики и значения (gauge) одного запуска.
+    Счетчик с причиной пишется как 'rejected:<причина>'.
+    В процессах-обработчиках свой экземпляр, его снимок забирается
+    вместе с результатом и складывается в основной (см. parse_pool).
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timers = Counter()
+        self.counters = Counter()
+        # значение, не сумма; из процессов-обработчиков - наибольшее
+        self.gauges = {}
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.timers[name] += seconds
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed(self, name: str):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def pop(self) -> dict:
+        '''
+        Забирает накопленное и обнуляет.
+        '''
+        with self._lock:
+            snapshot = {'timers': dict(self.timers), 'counters': dict(self.counters),
+                        'gauges': dict(self.gauges)}
+            self.timers.clear()
+            self.counters.clear()
+            self.gauges.clear()
+        return snapshot
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            self.timers.update(snapshot['timers'])
+            self.counters.update(snapshot['counters'])
+            for name, value in snapshot.get('gauges', {}).items():
+                self.gauges[name] = max(self.gauges.get(name, value), value)
+
+    def report(self, file=None):
+        file = file or sys.stderr
+        with self._lock:
+            timers, counters, gauges = dict(self.timers), dict(self.counters), dict(self.gauges)
+        print('---- stats ----', file=file)
+        for name, seconds in sorted(timers.items(), key=lambda i: -i[1]):
+            print(f'{name:<32}{seconds:>12.3f} s', file=file)
+        for name, value in sorted(counters.items()):
+            print(f'{name:<32}{value:>12}', file=file)
+        for name, value in sorted(gauges.items()):
+            print(f'{name:<32}{value:>12.2f}', file=file)
+        # полосы загрузки по хостам (Pipeline(lanes=True)): запросов в секунду
+        for name, value in sorted(counters.items()):
+            host = name.partition('lane_requests:')[2]
+            if host and timers.get(f'lane:{host}'):
+                print(f'{"rate:" + host:<32}{value / timers["lane:" + host]:>12.2f} req/s', file=file)
+
+    def to_prometheus(self) -> str:
+        lines = ['# TYPE parsers_stage_seconds counter']
+        for name, seconds in sorted(self.timers.items()):
+            if ':' not in name:
+                lines.append(f'parsers_stage_seconds{{stage="{name}"}} {seconds:.6f}')
+        # время по хостам (lane:<host>) - не стадия, отдельная метрика
+        timers = {name: value for name, value in self.timers.items() if ':' in name}
+        _families(lines, timers, '{}_seconds', 'counter', '.6f')
+        _families(lines, self.counters, '{}_total', 'counter', '')
+        _families(lines, self.gauges, '{}', 'gauge', '.6f')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        '''
+        *.json - json, иначе текстовый формат Prometheus.
+        '''
+        with self._lock, open(path, 'w', encoding='utf-8') as f:
+            if path.endswith('.json'):
+                json.dump({'timers': self.timers, 'counters': self.counters, 'gauges': self.gauges}, f,
+                          ensure_ascii=False, indent=1, sort_keys=True)
+            else:
+                f.write(self.to_prometheus())
+
+
+def _families(lines: list, values: dict, metric: str, kind: str, spec: str):
+    '''
+    'имя:значение' -> parsers_<имя>{<метка>="значение"}, одна строка TYPE на метрику.
+    '''
+    typed = set()
+    for name, value in sorted(values.items()):
+        family, _, label = name.partition(':')
+        name = 'parsers_' + metric.format(family)
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+        if label:
+            label = label.replace('\\', '\\\\').replace('"', '\\"')
+            name += f'{{{LABELS.get(family, "kind")}="{label}"}}'
+        lines.append(f'{name} {value:{spec}}')
+
+
+STATS = Stats()
+
+if hasattr(os, 'register_at_fork'):
+    # пул разбора создается из потока конвейера: в момент fork замок мог
+    # держать другой поток, в процессе-обработчике его некому отпустить
+    os.register_at_fork(after_in_child=lambda: setattr(STATS, '_lock', threading.Lock()))
+
+
+def maxrss() -> float:
+    '''
+    Наибольший объем памяти процесса за все время (МБ), 0 - неизвестно.
+    '''
+    if resource is None:
+        return 0.0
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss в КБ, на macOS в байтах
+    return kb / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def rss() -> float:
+    '''
+    Текущий объем памяти процесса (МБ). Без /proc (не Linux) - наибольший
+    за все время (maxrss).
+    '''
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return maxrss()
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def report(args):
+    '''
+    Итог запуска: сводка в stderr и, если просили, файл метрик.
+    '''
+    STATS.report()
+    if getattr(args, 'metrics', None):
+        STATS.write(args.metrics)
@@ -0,0 +1,77 @@
+import sqlite3
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS partitions (
+    idx INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    node TEXT,
+    taken REAL,
+    done INTEGER NOT NULL DEFAULT 0
+)
+'''
+
+
+def parse_shard(value: str) -> tuple:
+    '''
+    '2/4' -> (2, 4); шарды нумеруются с 1.
+    '''
+    shard, shards = (int(part) for part in value.split('/'))
+    if not 1 <= shard <= shards:
+        raise ValueError(f'shard {value!r}: нужно i/N, 1 <= i <= N')
+    return shard, shards
+
+
+def shard_of(idx: int, shards: int) -> int:
+    # через один: у каждого шарда и дешевые, и дорогие разделы
+    return idx % shards + 1
+
+
+class Coordinator:
+    '''
+    Раздача разделов выдачи узлам через общий файл SQLite (-a coordinator=PATH).
+    Узел берет сначала разделы своего шарда, потом свободные разделы других
+    шардов, потом взятые, но не законченные дольше lease секунд (узел упал).
+    '''
+
+    def __init__(self, path: str, shard: int, shards: int, node: str, lease: float = 3600):
+        self.shard = shard
+        self.shards = shards
+        self.node = node
+        self.lease = lease
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(SCHEMA)
+
+    def register(self, urls):
+        self.db.execute('BEGIN IMMEDIATE')
+        self.db.executemany('INSERT OR IGNORE INTO partitions (idx, url, shard) VALUES (?, ?, ?)',
+                            ((idx, url, shard_of(idx, self.shards)) for idx, url in enumerate(urls)))
+        self.db.execute('COMMIT')
+
+    def claim(self):
+        '''
+        Номер следующего раздела для этого узла или None.
+        '''
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.db.execute(
+                'SELECT idx FROM partitions WHERE NOT done AND (node IS NULL OR taken < ?) '
+                'ORDER BY node IS NOT NULL, shard != ?, idx LIMIT 1',
+                (now - self.lease, self.shard)).fetchone()
+            if row:
+                self.db.execute('UPDATE partitions SET node = ?, taken = ? WHERE idx = ?',
+                                (self.node, now, row[0]))
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return row[0] if row else None
+
+    def done(self, idx: int):
+        self.db.execute('UPDATE partitions SET done = 1 WHERE idx = ?', (idx,))
+
+    def close(self):
+        self.db.close()
@@ -1,5 +1,17 @@
+import os
+import socket
+
 import scrapy
 
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+
+from tutorial.coordinator import Coordinator, parse_shard, shard_of
+
+# объявления раньше следующих страниц выдачи: очередь не копит страницы
+DETAIL_PRIORITY = 10
+LISTING_PRIORITY = 0
+
 
 class AuthorSpider(scrapy.Spider):
     name = 'dromRU'
@@ -16,7 +28,80 @@ class AuthorSpider(scrapy.Spider):
         # over 6 000 000
         yield url+'?minprice=%d' % (6_000_000)
 
-    start_urls = (link for link in gen("https://auto.drom.ru/bez-probega/all/"))
+    # разделы выдачи (цена x пробег), открываются не больше DROM_PARTITIONS сразу
+    partitions = list(gen("https://auto.drom.ru/bez-probega/all/"))
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.max_partitions = crawler.settings.getint('DROM_PARTITIONS', 8)
+        # с JOBDIR расширение SpiderState заменит на сохраненное состояние
+        spider.state = {}
+        # -a shard=i/N: узел берет разделы с номером idx % N == i - 1
+        spider.shard, spider.shards = parse_shard(kwargs.get('shard', '1/1'))
+        # -a coordinator=PATH: разделы раздаются через общий файл, свободные -
+        # узлам, которые закончили свой шард
+        spider.coordinator = None
+        if kwargs.get('coordinator'):
+            spider.coordinator = Coordinator(
+                kwargs['coordinator'], spider.shard, spider.shards,
+                node=f'{socket.gethostname()}:{os.getpid()}',
+                lease=crawler.settings.getfloat('DROM_LEASE', 3600))
+            spider.coordinator.register(spider.partitions)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        return spider
+
+    def start_requests(self):
+        yield from self.open_partitions()
+
+    def next_partition(self):
+        if self.coordinator:
+            return self.coordinator.claim()
+        state = self.state
+        while state['next'] < len(self.partitions):
+            idx = state['next']
+            state['next'] += 1
+            if shard_of(idx, self.shards) == self.shard:
+                return idx
+        return None
+
+    def open_partitions(self):
+        '''
+        Следующие разделы, пока открыто меньше max_partitions.
+        '''
+        state = self.state
+        state.setdefault('next', 0)
+        state.setdefault('open', 0)
+        while state['open'] < self.max_partitions:
+            idx = self.next_partition()
+            if idx is None:
+                break
+            state['open'] += 1
+            self.crawler.stats.inc_value('drom/partitions')
+            yield self.listing(self.partitions[idx], idx)
+
+    def listing(self, url, idx):
+        return scrapy.Request(url, callback=self.parse, errback=self.partition_failed,
+                              priority=LISTING_PRIORITY, meta={'partition': idx})
+
+    def partition_done(self, idx):
+        if self.coordinator:
+            self.coordinator.done(idx)
+        self.state['open'] = max(self.state['open'] - 1, 0)
+        yield from self.open_partitions()
+
+    def partition_failed(self, failure):
+        yield from self.partition_done(failure.request.meta['partition'])
+
+    def spider_idle(self, spider):
+        # раздел, страница которого не дошла до parse (ошибка разбора, дубликат),
+        # не закрылся: в простое открытых разделов нет
+        self.state['open'] = 0
+        requests = list(self.open_partitions())
+        for request in requests:
+            self.crawler.engine.crawl(request)
+        if requests:
+            raise DontCloseSpider
 
     def parse(self, response):
         for car in response.xpath('.//a[@data-ftid="bulls-list_bull"]'):
@@ -33,10 +118,16 @@ class AuthorSpider(scrapy.Spider):
 
             yield scrapy.Request(car_page_link,
                                  callback=self.parse_car,
-                                 cb_kwargs=dict(header=header, price=price, city=city, docs=docs, broken=broken, estimation=estimation))
+                                 cb_kwargs=dict(header=header, price=price, city=city, docs=docs, broken=broken, estimation=estimation),
+                                 priority=DETAIL_PRIORITY)
 
         pagination_links = response.xpath('.//a[@data-ftid="component_pagination-item-next"]')
-        yield from response.follow_all(pagination_links, self.parse)
+        if pagination_links:
+            yield from response.follow_all(pagination_links, self.parse, errback=self.partition_failed,
+                                           priority=LISTING_PRIORITY,
+                                           meta={'partition': response.meta['partition']})
+        else:
+            yield from self.partition_done(response.meta['partition'])
 
     def parse_car(self, response, header, price, city, docs, broken, estimation):
         key = ['Заголовок', 'Цена', 'Город', 'docs', 'broken', 'Оценка']
@@ -47,3 +138,7 @@ class AuthorSpider(scrapy.Spider):
             ".//td/text()[1]|.//td/span/text()[1]|.//td/span/a/text()[1]|.//td/a/text()[1]").getall()  # - значения словаря
 
         yield dict(zip(key, arg))
+
+    def closed(self, reason):
+        if self.coordinator:
+            self.coordinator.close()
@@ -0,0 +1,39 @@
+'''
+Слияние баз узлов шардированного обхода в одну:
+
+    python merge.py dromRU.sqlite dromRU-1.sqlite dromRU-2.sqlite ...
+
+Строки упорядочены по всем колонкам, одинаковые (раздел, пересобранный
+другим узлом) - один раз: результат не зависит от порядка баз и узлов.
+'''
+import sqlite3
+import sys
+
+from pipelines import COLUMNS, TYPES
+
+
+def merge(target: str, sources: list):
+    names = list(COLUMNS.values()) + ['extra']
+    columns = ', '.join(f'{name} {TYPES.get(name, "TEXT")}' for name in names)
+    order = ', '.join(names)
+    # ATTACH нельзя внутри транзакции, транзакции - явно
+    db = sqlite3.connect(target, isolation_level=None)
+    db.execute(f'CREATE TEMP TABLE merged ({columns})')
+    for path in sources:
+        db.execute('ATTACH DATABASE ? AS src', (path,))
+        db.execute(f'INSERT INTO merged SELECT {order} FROM src.cars')
+        db.execute('DETACH DATABASE src')
+    db.execute('BEGIN')
+    db.execute('DROP TABLE IF EXISTS cars')
+    db.execute(f'CREATE TABLE cars ({columns})')
+    db.execute(f'INSERT INTO cars SELECT DISTINCT {order} FROM merged ORDER BY {order}')
+    db.execute('COMMIT')
+    count = db.execute('SELECT count(*) FROM cars').fetchone()[0]
+    db.close()
+    return count
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        sys.exit(__doc__)
+    print(merge(sys.argv[1], sys.argv[2:]))
@@ -0,0 +1,115 @@
+import json
+import re
+import sqlite3
+
+# ключ из объявления -> колонка таблицы
+COLUMNS = {
+    'Заголовок': 'title',
+    'Цена': 'price',
+    'Город': 'city',
+    'docs': 'docs',
+    'broken': 'broken',
+    'Оценка': 'estimation',
+    'Двигатель': 'engine',
+    'Мощность': 'power',
+    'Трансмиссия': 'transmission',
+    'Привод': 'drive',
+    'Тип кузова': 'body',
+    'Цвет': 'color',
+    'Пробег, км': 'mileage',
+    'Руль': 'wheel',
+    'Поколение': 'generation',
+    'Комплектация': 'equipment',
+}
+TYPES = {'price': 'INTEGER', 'power': 'INTEGER', 'mileage': 'INTEGER',
+         'docs': 'INTEGER', 'broken': 'INTEGER'}
+
+NUMBER_RE = re.compile(r'\d[\d\s]*')
+
+
+def to_int(value):
+    # '1 250 000' (с неразрывными пробелами), '150 л.с., налог', '45 000, без пробега по РФ'
+    if value is None or isinstance(value, int):
+        return value
+    match = NUMBER_RE.search(value)
+    if not match:
+        return None
+    return int(re.sub(r'\s', '', match.group(0)))
+
+
+def to_flag(value):
+    if value is None:
+        return None
+    return int(bool(value))
+
+
+def normalize(item: dict) -> tuple:
+    '''
+    Строка таблицы: колонки в порядке COLUMNS, остальные ключи - json в extra.
+    '''
+    row = {}
+    extra = {}
+    for key, value in item.items():
+        if isinstance(value, str):
+            value = value.strip()
+        column = COLUMNS.get(key)
+        if column is None:
+            extra[key] = value
+        elif column in ('price', 'power', 'mileage'):
+            row[column] = to_int(value)
+        elif column in ('docs', 'broken'):
+            row[column] = to_flag(value)
+        else:
+            row[column] = value
+    values = tuple(row.get(column) for column in COLUMNS.values())
+    return values + (json.dumps(extra, ensure_ascii=False) if extra else None,)
+
+
+class DromSQLitePipeline:
+    '''
+    Объявления пишутся в SQLite (DROM_SQLITE, по умолчанию dromRU.sqlite)
+    с типами: цена, пробег и мощность - целые, docs/broken - 0/1.
+    Строки копятся в памяти и вставляются пачками по DROM_BATCH_SIZE
+    одной транзакцией, а не по одной.
+    '''
+
+    def __init__(self, path: str, batch_size: int, stats=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.stats = stats
+        self.buffer = []
+        self.db = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(settings.get('DROM_SQLITE', 'dromRU.sqlite'),
+                   settings.getint('DROM_BATCH_SIZE', 5000), crawler.stats)
+
+    def open_spider(self, spider):
+        self.db = sqlite3.connect(self.path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        columns = ', '.join(f'{name} {TYPES.get(name, "TEXT")}' for name in COLUMNS.values())
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS cars ({columns}, extra TEXT)')
+
+    def process_item(self, item, spider):
+        self.buffer.append(normalize(dict(item)))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+        return item
+
+    def flush(self):
+        if not self.buffer:
+            return
+        placeholders = ', '.join('?' * (len(COLUMNS) + 1))
+        with self.db:
+            self.db.executemany(f'INSERT INTO cars VALUES ({placeholders})', self.buffer)
+        if self.stats:
+            self.stats.inc_value('drom/rows', len(self.buffer))
+            self.stats.inc_value('drom/batches')
+        self.buffer = []
+
+    def close_spider(self, spider):
+        self.flush()
+        self.db.close()
@@ -20,16 +20,18 @@ FEEDS = {
 }
 '''
 
-FEEDS = {
-    "dromRU.csv": {
-        'format': 'csv',
-        'fields': ['Заголовок', 'Цена', 'Город', 'docs', 'broken', 'Оценка',
-                   "Двигатель", "Мощность", "Трансмиссия", "Привод", "Тип кузова",
-                   "Цвет", "Пробег, км", "Руль", "Поколение",
-                   "Комплектация", "Характеристики", "Регистрации",
-                   "Розыск", "Ограничения", "Особые отметки"],
-    },
-}
+# объявления пишутся пачками в SQLite с типами (pipelines.py), а не построчно в CSV;
+# CSV при необходимости: scrapy crawl dromRU -o dromRU.csv
+DROM_SQLITE = 'dromRU.sqlite'
+DROM_BATCH_SIZE = 5000
+
+# очередь запросов на диске, обход можно остановить и продолжить:
+#   scrapy crawl dromRU -s JOBDIR=crawls/dromRU-1
+# (новый обход - новый каталог). Страницы объявлений идут раньше следующих
+# страниц выдачи, одновременно открыто не больше DROM_PARTITIONS разделов
+DROM_PARTITIONS = 8
+SCHEDULER_DISK_QUEUE = 'scrapy.squeues.PickleLifoDiskQueue'
+SCHEDULER_MEMORY_QUEUE = 'scrapy.squeues.LifoMemoryQueue'
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 #USER_AGENT = 'tutorial (+http://www.yourdomain.com)'
 
@@ -79,9 +81,9 @@ ROBOTSTXT_OBEY = False
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    'tutorial.pipelines.TutorialPipeline': 300,
-#}
+ITEM_PIPELINES = {
+    'tutorial.pipelines.DromSQLitePipeline': 300,
+}
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
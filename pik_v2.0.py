@@ -1,13 +1,17 @@
-import json
-import urllib3
-import requests
 import re
-import sys
-from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple
 from time import sleep
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from common.cli import finish, parse_args, setup
+from common.http import body_stream, session
+from common.jsonstream import items
+from common.output import dump
+from common.pacing import PACER
+from common.parse_pool import ParsePool
+from common.pipeline import Job, Pipeline, Throttle
+from common.quarantine import QUARANTINE, Rejected
+from common.sink import SINK
+from common.stats import STATS
 
 
 def init_realty_object(complex_name: str, region: str, realty_type: str) -> dict:
@@ -48,8 +52,10 @@ def init_realty_object(complex_name: str, region: str, realty_type: str) -> dict
 
 
 class PikParser:
-    def __init__(self):
-        self.thread_pool = ThreadPoolExecutor(max_workers=20)
+    def __init__(self, args=None):
+        self.args = args or parse_args([])
+        # запросы идут из потока загрузки и из основного потока (апартаменты)
+        self.throttle = Throttle(0.5)
         self.realty_types_map = {
             '1': 'flat',
             '2': 'apartment',
@@ -60,66 +66,109 @@ class PikParser:
         self.realty_objects = []
         self.errors = []
 
-    @staticmethod
-    def request(url: str, max_attempts: int = 3) -> Dict:
+    def request(self, url: str, max_attempts: int = 3, raw: bool = False,
+                prefix: str = None, each=None, min_interval: float = 0.0) -> Dict:
         '''
-        Умеет повторить HTTP запрос через 5, 10 и 15 секунд.
+        Умеет повторить HTTP запрос: с --pace adaptive через интервал,
+        увеличенный после ошибки (common.pacing), иначе через 5, 10 и 15 секунд.
         После трех неудачных попыток, бросит исключение.
         Кол-во попыток задается параметром.
+        raw=True - вернуть тело ответа без разбора json.
+        min_interval - пауза перед запросом, если нужна больше обычной 0.5сек.
+        prefix - разбирать ответ по мере загрузки и вернуть [each(элемент)]
+        для элементов по пути prefix (None из each пропускаются). Ошибка each -
+        не повод загружать ответ заново: элемент уходит в карантин.
         '''
         errors = []
         timeout_between_requests = 5
         for t in range(max_attempts):
+            if errors:
+                STATS.incr('retries')
+                if not PACER.enabled:
+                    sleep(timeout_between_requests * len(errors))
+            self.throttle.wait(url, min_interval)
             try:
-                with requests.get(url, verify=False, timeout=90) as response:
+                with session().get(url, verify=False, timeout=90, stream=bool(prefix)) as response:
+                    if prefix:
+                        return self.collect(items(body_stream(response), prefix), each, url)
+                    if raw:
+                        return response.content
                     return response.json()
             except Exception as e:
                 errors.append(e)
-            sleep(timeout_between_requests * len(errors))
+                self.throttle.failed(url, e)
         message = f'HTTP request failed: max retries exceeded with url {url}'
         raise Exception(message) from errors.pop()
 
+    @staticmethod
+    def collect(elements, each, url: str) -> List:
+        results = []
+        for element in elements:
+            try:
+                result = each(element)
+            except Exception as e:
+                # плохой элемент каталога не должен обрывать его загрузку
+                QUARANTINE.add_error(e, element, url)
+                continue
+            if result is not None:
+                results.append(result)
+        return results
+
     def fetch_complexes(self) -> List[Tuple]:
-        complexes = []
         url = 'https://api.pik.ru/v2/filter?filter=1'
-        data = self.request(url)
-        for complex_data in data['block']:
-            name = complex_data['name']
-            name = name and name.strip()
-            if not name:
-                continue
-            name = name[:name.index('(') - 1:] if '(' in name else name
-            region = complex_data['locations']['parent']['name']
-            region = region.strip().capitalize()
-            if not region:
-                continue
-            complexes.append((complex_data['id'], name, region, complex_data['counts']))
+        # каталог большой: блоки разбираются по одному, пока ответ загружается
+        with STATS.timer('fetch'):
+            complexes = self.request(url, prefix='block.item', each=self.complex_entry)
+        STATS.incr('requests')
         return complexes
 
-    def load_realty_objects(self, complex_data: tuple, realty_type_id: str):
-        complex_id, complex_name, region = complex_data
-        try:
-            bulks = self.fetch_bulks(complex_id, realty_type_id)
-            realty_type_name = self.realty_types_map[realty_type_id]
-            for bulk in bulks:
-                raw_objects = self.fetch_realty_objects(realty_type_name, bulk)
-                self.create_realty_objects(complex_data, raw_objects)
-        except Exception as e:
-            self.errors.append(e)
+    @staticmethod
+    def complex_entry(complex_data: Dict) -> Tuple:
+        name = complex_data['name']
+        name = name and name.strip()
+        if not name:
+            return None
+        name = name[:name.index('(') - 1:] if '(' in name else name
+        region = complex_data['locations']['parent']['name']
+        region = region.strip().capitalize()
+        if not region:
+            return None
+        return complex_data['id'], name, region, complex_data['counts']
 
-    def fetch_bulks(self, complex_id: int, realty_type_id: str):
+    def bulks_url(self, complex_id: int, realty_type_id: str) -> str:
         base_url = 'https://api.pik.ru/v1/bulk/chessplan?new=1&block_id={complex_id}&types={realty_type}'
         # TODO: надо перейти на v2 API, там есть знание про аукцион
         # base_url = 'https://api.pik.ru/v2/filter?type={realty_type}&block={complex_id}'
-        url = base_url.format(complex_id=complex_id, realty_type=realty_type_id)
-        response = self.request(url)
-        sleep(1.5)
-        return response['bulks'] or []
+        return base_url.format(complex_id=complex_id, realty_type=realty_type_id)
 
-    def fetch_realty_objects(self, realty_type_name: str, bulk: Dict) -> List[Tuple]:
+    @staticmethod
+    def parse_bulks(page: bytes, complex_data: Tuple, realty_type_name: str):
+        for bulk in items(page, 'bulks.item'):
+            raw_objects = PikParser.fetch_realty_objects(realty_type_name, bulk)
+            yield complex_data, raw_objects
+
+    def add_error(self, error: Exception, job: Job = None):
+        self.errors.append(error)
+        QUARANTINE.page_error(error, job)
+
+    def save_realty_objects(self, result: Tuple) -> List[Dict]:
+        '''
+        Объекты корпуса из сырых данных. Готовые объекты возвращаются конвейеру:
+        с --schedule сохраняются они, а не сырые данные (по которым пришлось бы
+        снова запрашивать апартаменты).
+        '''
+        complex_data, raw_objects = result
+        return self.create_realty_objects(complex_data, raw_objects)
+
+    def keep_realty_object(self, realty_object: Dict):
+        self.realty_objects.append(realty_object)
+        SINK.add(realty_object)
+
+    @staticmethod
+    def fetch_realty_objects(realty_type_name: str, bulk: Dict) -> List[Tuple]:
         sections = bulk.get('sections')
         if not sections:
-            return
+            return []
         if bulk['name']:
             stop_list = ['дом', 'корпус', 'блок', 'строение', 'владение',
                          'вл', 'башня', 'д', 'вавилова', 'подземный', 'паркинг']
@@ -157,18 +206,33 @@ class PikParser:
                 )
         return raw_objects
 
-    def create_realty_objects(self, complex_data: Tuple, raw_objects: List[Tuple]):
+    def create_realty_objects(self, complex_data: Tuple, raw_objects: List[Tuple]) -> List[Dict]:
         complex_id, complex_name, region = complex_data
+        created = []
         for realty_type_name, building_id, section_id, floor, objects in raw_objects:
             for raw_data in objects:
                 realty_object = init_realty_object(complex_name, region, realty_type_name)
                 realty_object['building'] = building_id
                 realty_object['floor'] = int(floor)
                 realty_object['section'] = section_id
-                self.fill_realty_object(raw_data, realty_object, realty_type_name)
-                if self.validate_realty_object(realty_object):
-                    if realty_object['in_sale']:
-                        self.realty_objects.append(realty_object)
+                try:
+                    with STATS.timer('setters'):
+                        self.fill_realty_object(raw_data, realty_object, realty_type_name)
+                    with STATS.timer('final_check'):
+                        valid = self.validate_realty_object(realty_object)
+                except Exception as e:
+                    # плохой объект не должен обрывать загрузку всего корпуса
+                    QUARANTINE.add_error(e, raw_data, complex_data)
+                    continue
+                if not valid:
+                    STATS.incr('rejected:validate')
+                elif not realty_object['in_sale']:
+                    STATS.incr('rejected:not_in_sale')
+                else:
+                    self.keep_realty_object(realty_object)
+                    created.append(realty_object)
+                    STATS.incr('accepted')
+        return created
 
     def fill_realty_object(self, raw_data: dict, realty_object: dict, realty_type: str):
         # Общая часть
@@ -197,7 +261,9 @@ class PikParser:
         # Специфичные части
         if realty_type in {'flat', 'apartment'}:
             if realty_type == 'apartment' and realty_object['in_sale']:
-                res = self.request('https://api.pik.ru/v1/flat?id={}&similar=1'.format(raw_data['id']))
+                with STATS.timer('fetch'):
+                    res = self.request('https://api.pik.ru/v1/flat?id={}&similar=1'.format(raw_data['id']))
+                STATS.incr('requests')
                 if res and res.get('layout'):
                     realty_object['article'] = res['layout']['name']
                     realty_object['plan'] = res.get('layout').get('flat_plan_svg') or \
@@ -224,12 +290,12 @@ class PikParser:
         rooms = realty_object['rooms'] or 0
         area = realty_object['area'] or 0
         if isinstance(rooms, int) and rooms > 10 and area < 100:
-            raise Exception(f'Маленькая площадь ({area}) при большом кол-ве комнат ({rooms})')
+            raise Rejected('rooms_area', f'Маленькая площадь ({area}) при большом кол-ве комнат ({rooms})')
         if isinstance(rooms, int) and rooms > 30:
-            raise Exception(f'Слишком большое кол-во комнат ({rooms})')
+            raise Rejected('rooms', f'Слишком большое кол-во комнат ({rooms})')
         floor = realty_object['floor'] or 0
         if floor > 100:
-            raise Exception(f'Слишком большое кол-во этажей ({floor})')
+            raise Rejected('floor', f'Слишком большое кол-во этажей ({floor})')
         realty_type = realty_object['type']
         if realty_type in {'flat', 'apartment', 'parking'} and area < 10:
             return False
@@ -251,14 +317,30 @@ class PikParser:
         return True
 
     def run(self):
+        setup(self.args, 'pik')
         complexes = self.fetch_complexes()
+        jobs = []
         for complex_data in complexes:
             for type_id, type_name in self.realty_types_map.items():
                 if complex_data[3][type_id] != 0:
-                    self.load_realty_objects(complex_data[0:3], type_id)
+                    jobs.append(Job(self.bulks_url(complex_data[0], type_id), 'bulks',
+                                    (complex_data[0:3], type_name)))
+        # пауза 1.5сек между загрузками корпусов, как и раньше
+        pool = ParsePool.from_args({'bulks': PikParser.parse_bulks}, None, self.args)
+        # паузу соблюдает сам request, через общий self.throttle: иначе каждый
+        # корпус ждал бы дважды (второй Throttle в конвейере)
+        pipeline = Pipeline(lambda url: self.request(url, raw=True, min_interval=1.5), pool,
+                            self.save_realty_objects, on_error=self.add_error, recrawl=('bulks',),
+                            carried=self.keep_realty_object)
+        pipeline.run(jobs)
+
+        dump(self.realty_objects, self.args)
+        finish(self.args)
+
 
-        print(json.dumps(self.realty_objects, sort_keys=False, ensure_ascii=False))
+def main(args):
+    PikParser(args).run()
 
 
 if __name__ == '__main__':
-    PikParser().run()
+    main(parse_args())
@@ -0,0 +1,22 @@
+from common.delta import delta
+
+# две одинаковые по ключу квартиры без номера, разные цены
+UNITS = [
+    {'complex': 'A', 'building': '1', 'floor': 2, 'rooms': 1, 'area': 30.5, 'price_base': 100},
+    {'complex': 'A', 'building': '1', 'floor': 2, 'rooms': 1, 'area': 30.5, 'price_base': 200},
+]
+
+
+def test_swapped_units_not_updated(tmp_path):
+    path = str(tmp_path / 'snapshot.jsonl.gz')
+    first = delta(UNITS, path)
+    assert first['insert'] == UNITS
+    assert delta(UNITS[::-1], path) == {'insert': [], 'update': [], 'delete': []}
+
+
+def test_changed_unit_reported(tmp_path):
+    path = str(tmp_path / 'snapshot.jsonl.gz')
+    delta(UNITS, path)
+    changed = [UNITS[0], dict(UNITS[1], price_base=300)]
+    result = delta(changed, path)
+    assert len(result['insert']) + len(result['update']) + len(result['delete']) > 0
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+DROM = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'drom_ru')
+
+
+@pytest.fixture
+def drom(monkeypatch):
+    # модули проекта scrapy импортируются из его каталога (merge: from pipelines import ...)
+    monkeypatch.syspath_prepend(DROM)
+    import coordinator
+    import merge
+    import pipelines
+
+    return coordinator, merge, pipelines
+
+
+def test_claim_order(tmp_path, drom):
+    coordinator = drom[0]
+    path = str(tmp_path / 'coordinator.sqlite')
+    first = coordinator.Coordinator(path, 1, 2, 'first')
+    second = coordinator.Coordinator(path, 2, 2, 'second')
+    urls = [f'https://auto.drom.ru/all/page{n}/' for n in range(1, 6)]
+    first.register(urls)
+    second.register(urls)
+    # шард 1 - разделы 0, 2, 4, шард 2 - 1, 3
+    assert [first.claim() for _ in range(3)] == [0, 2, 4]
+    assert second.claim() == 1
+    # свои закончились: свободный раздел чужого шарда
+    assert first.claim() == 3
+    assert first.claim() is None
+    assert second.claim() is None
+    for idx in (0, 2, 3, 4):
+        first.done(idx)
+    # раздел узла, который не закончил его за lease, можно забрать
+    time.sleep(0.01)
+    late = coordinator.Coordinator(path, 1, 2, 'late', lease=0)
+    assert late.claim() == 1
+    assert second.claim() is None
+    for node in (first, second, late):
+        node.close()
+
+
+def write(drom, path, items):
+    pipeline = drom[2].DromSQLitePipeline(path, batch_size=2)
+    pipeline.open_spider(None)
+    for item in items:
+        pipeline.process_item(item, None)
+    pipeline.close_spider(None)
+
+
+def test_merge_independent_of_order(tmp_path, drom):
+    car = {'Заголовок': 'Lada Vesta', 'Цена': '900 000', 'Город': 'Томск', 'url': 'a'}
+    other = {'Заголовок': 'Kia Rio', 'Цена': '1 100 000', 'Пробег, км': '10 000'}
+    sources = [str(tmp_path / 'dromRU-1.sqlite'), str(tmp_path / 'dromRU-2.sqlite')]
+    # раздел с car собран обоими узлами
+    write(drom, sources[0], [car, other])
+    write(drom, sources[1], [dict(car, **{'Цена': '850 000'}), car])
+
+    results = []
+    for order in (sources, sources[::-1]):
+        target = str(tmp_path / f'merged-{len(results)}.sqlite')
+        count = drom[1].merge(target, order)
+        with sqlite3.connect(target) as db:
+            results.append((count, db.execute('SELECT * FROM cars').fetchall()))
+    assert results[0] == results[1]
+    assert results[0][0] == 3
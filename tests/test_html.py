@@ -0,0 +1,56 @@
+import pytest
+
+from common.html import make_soup, release_trees, scan_rows
+
+pytest.importorskip('bs4')
+pytest.importorskip('html5lib')
+
+PAGE = '''<html><body>
+<div class="adaptive-table other">
+  <table>
+    <tr class="head"><th>Этаж</th><th>Секция</th><th>Номер</th></tr>
+    <tr data-price="5 000 000" data-floor="3" data-title="&quot;Дом&quot; &amp; сад">
+      <td>3</td><td><div class="cell"><div>1</div></div></td><td>М-12</td>
+    </tr>
+    <tr data-price="4 100 000" data-floor="4" data-square="13,5" data-floor="40">
+      <td>4</td><td>2</td><td>М-13</td>
+    <tr data-price="" data-empty data-floor="5" class="sold  last" accesskey="">
+      <td>5</td><td>2</td><td>М-14</td>
+    </tr>
+  </table>
+  <div class="inner"><div>вложенный div не закрывает таблицу</div></div>
+  <table><tr data-floor="6"><td>6</td><td>3</td><td>М-15</td></tr></table>
+</div>
+<div class="adaptive-table">
+  <table><tr data-floor="99"><td>из второй таблицы</td></tr></table>
+</div>
+</body></html>'''
+
+
+def soup_rows(page):
+    # как было до scan_rows: дерево всей страницы
+    container = make_soup(page).find('div', class_='adaptive-table')
+    return container.find_all('tr')[1:]
+
+
+def test_scan_rows_attrs_match_bs4():
+    expected = [tag.attrs for tag in soup_rows(PAGE)]
+    rows = scan_rows(PAGE, 'tr', container=('div', 'adaptive-table'), skip=1)
+    assert [row.attrs for row in rows] == expected
+    # вложенные div внутри контейнера, вторая adaptive-table не попадает
+    assert [row['data-floor'] for row in rows] == ['3', '4', '5', '6']
+    assert rows[0]['data-title'] == '"Дом" & сад'
+    release_trees()
+
+
+def test_scanned_row_tag_matches_bs4():
+    # как extract_park: номер места - из текста третьей ячейки
+    expected = [tag.find_all('td')[2].text for tag in soup_rows(PAGE)]
+    rows = scan_rows(PAGE, 'tr', container=('div', 'adaptive-table'), skip=1)
+    assert [row.find_all('td')[2].text for row in rows] == expected
+    assert rows[0].find('div', class_='cell').text == '1'
+    release_trees()
+
+
+def test_scan_rows_without_container():
+    assert scan_rows('<div class="table"><tr></tr></div>', 'tr', container=('div', 'adaptive-table')) is None
@@ -0,0 +1,69 @@
+import json
+
+from decimal import Decimal
+
+import pytest
+
+from common import numeric
+from common.identity import canonical
+
+# .5 к четному, отрицательные, целые, из json (float)
+PRICES = ['2.5', '3.5', '-2.5', '-3.5', '0.5', '1.5', '1234567.49', '1234567.5', '-0.4', '7',
+          '12.345', 2.5, 3.5, -2.5, 1234.5, 0.1, 19999.999, -0.0, '-0']
+AREAS = ['30.5', '45.60', '-1.25', '12', '0.01', 30.5, 45.6, 33.33, 0.07, 120.0]
+# три знака после точки - в сотых точно не представить, остается Decimal;
+# отрицательный ноль - тоже (выводится как -0.0)
+INEXACT_AREAS = ['30.555', '0.001', '-1.005', '-0.00', -0.0]
+
+
+class DecimalEncoder(json.JSONEncoder):
+    # как у сайтов: Decimal выводится числом
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return float(o)
+        return super().default(o)
+
+
+@pytest.fixture
+def int_mode(monkeypatch):
+    monkeypatch.setattr(numeric, 'MODE', 'int')
+
+
+def output(value) -> str:
+    return json.dumps(numeric.export({'value': value}), cls=DecimalEncoder)
+
+
+@pytest.mark.parametrize('multi', [1, 1000])
+@pytest.mark.parametrize('value', PRICES)
+def test_price_matches_decimal(int_mode, value, multi):
+    expected = round(Decimal(value) * multi, 0)
+    result = numeric.price(value, multi)
+    # кроме -0: он остается Decimal
+    assert isinstance(result, numeric.Roubles) or expected.is_signed() and expected.is_zero()
+    assert result == expected
+    assert output(result) == output(expected)
+    assert canonical(result) == canonical(expected)
+
+
+@pytest.mark.parametrize('value', AREAS)
+def test_area_matches_decimal(int_mode, value):
+    expected = Decimal(value)
+    result = numeric.area(value)
+    assert isinstance(result, numeric.Hundredths)
+    assert output(result) == output(expected)
+    if isinstance(value, str):
+        assert Decimal(int(result)) / 100 == expected
+        assert canonical(result) == canonical(expected)
+
+
+@pytest.mark.parametrize('value', INEXACT_AREAS)
+def test_inexact_area_stays_decimal(int_mode, value):
+    assert numeric.area(value) == Decimal(value)
+    assert type(numeric.area(value)) is Decimal
+
+
+def test_decimal_mode_unchanged():
+    assert numeric.MODE == 'decimal'
+    assert numeric.price('2.5') == Decimal('2')
+    assert type(numeric.price('2.5')) is Decimal
+    assert type(numeric.area('30.5')) is Decimal
@@ -0,0 +1,19 @@
+from common import pipeline
+from common.pacing import Pacer
+from common.pipeline import Throttle
+
+URL = 'https://api.pik.ru/v1/flat?id=7'
+
+
+def test_failed_ignores_errors_with_response(monkeypatch):
+    pacer = Pacer()
+    pacer.open()
+    monkeypatch.setattr(pipeline, 'PACER', pacer)
+    monkeypatch.setattr(Throttle, 'enabled', True)
+    throttle = Throttle(0.5)
+    throttle.wait(URL)
+    # 5xx уже учтен в common.http, здесь - только ошибка разбора его тела
+    pacer.observe('api.pik.ru', 0.1, 503)
+    rate = pacer._rates['api.pik.ru']
+    throttle.failed(URL, ValueError('Expecting value: line 1 column 1'))
+    assert pacer._rates['api.pik.ru'] == rate
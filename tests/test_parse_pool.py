@@ -0,0 +1,53 @@
+from common.parse_pool import ParsePool
+from common.stats import STATS
+
+
+def parse_small(page):
+    yield {'url': page.decode()}
+
+
+def test_max_rss_ignores_parent_memory():
+    # основной процесс большой, процессы разбора после fork - нет
+    parent = bytearray(256 * 1024 * 1024)
+    for i in range(0, len(parent), 4096):
+        parent[i] = 1
+    STATS.pop()
+    pool = ParsePool({'page': parse_small}, workers=1, max_rss=64)
+    pool.start()
+    try:
+        for n in range(5):
+            future = pool.submit([('page', f'p{n}'.encode(), ())])
+            results = pool.result(future)
+            assert list(pool.unpack(results[0][1])) == [{'url': f'p{n}'}]
+    finally:
+        pool.shutdown()
+    stats = STATS.pop()
+    assert stats['counters'].get('pool:recycled', 0) == 0
+    assert stats['gauges']['maxrss:parse'] < 64
+    del parent
+
+
+def test_fork_while_stats_locked():
+    # пул запускается, когда замок STATS держит другой поток (загрузка)
+    import threading
+
+    locked, release = threading.Event(), threading.Event()
+
+    def hold():
+        with STATS._lock:
+            locked.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    locked.wait()
+    pool = ParsePool({'page': parse_small}, workers=1)
+    pool.start()
+    try:
+        future = pool.submit([('page', b'p', ())])
+        assert future.result(timeout=30)
+    finally:
+        release.set()
+        thread.join()
+        pool.shutdown(wait=False)
+    STATS.pop()
@@ -0,0 +1,84 @@
+import json
+
+from common import http
+from common.corpus import CorpusWriter
+from common.http import ReplaySession
+from common.pipeline import Throttle
+from common.sites import load_site
+from common.stats import STATS
+
+CATALOGUE_URL = 'https://api.pik.ru/v2/filter?filter=1'
+FLAT_URL = 'https://api.pik.ru/v1/flat?id=7&similar=1'
+PAGES = {
+    CATALOGUE_URL: {'block': [{
+        'id': 1, 'name': 'Парк', 'locations': {'parent': {'name': 'москва'}},
+        'counts': {'1': 0, '2': 1, '4': 0, '5': 0, '6': 0},
+    }]},
+    'https://api.pik.ru/v1/bulk/chessplan?new=1&block_id=1&types=2': {'bulks': [{
+        'name': 'корпус 1',
+        'sections': [{'name': 'Секция 2', 'floors': {'3': {'flats': [{
+            'id': 7, 'status': 'free', 'area': '40.5', 'number': '1', 'price': 5000000,
+            'apartment_number': '12', 'rooms': '1', 'stage_number': '3', 'layout': {'name': 'A'},
+        }]}}}],
+    }]},
+    FLAT_URL: {'layout': {'name': 'A1', 'flat_plan_svg': 'plan.svg'}},
+}
+
+
+def replay(tmp_path, monkeypatch, pages: dict) -> tuple:
+    '''
+    Набор страниц pages и список запрошенных из него url.
+    '''
+    corpus = str(tmp_path / 'pik.corpus')
+    writer = CorpusWriter(corpus)
+    for url, body in pages.items():
+        writer.add(url, json.dumps(body).encode())
+    writer.close()
+
+    fetched = []
+    replay_get = ReplaySession.get
+
+    def get(session, url, **kwargs):
+        fetched.append(url)
+        return replay_get(session, url, **kwargs)
+
+    monkeypatch.setattr(ReplaySession, 'get', get)
+    monkeypatch.setattr(Throttle, 'enabled', Throttle.enabled)
+    monkeypatch.setattr(http, '_session', None)
+    return corpus, fetched
+
+
+def test_bad_catalogue_block_not_retried(tmp_path, monkeypatch):
+    catalogue = json.loads(json.dumps(PAGES[CATALOGUE_URL]))
+    catalogue['block'].insert(0, {'id': 2, 'name': 'Без региона', 'counts': {}})
+    corpus, fetched = replay(tmp_path, monkeypatch, {CATALOGUE_URL: catalogue})
+    pik = load_site('pik')
+    http.use_corpus(corpus)
+    Throttle.enabled = False
+    STATS.pop()
+
+    complexes = pik.PikParser(pik.parse_args(['--workers', '0'])).fetch_complexes()
+
+    counters = STATS.pop()['counters']
+    assert [complex_data[0] for complex_data in complexes] == [1]
+    assert fetched == [CATALOGUE_URL]
+    assert counters['rejected:KeyError'] == 1
+    assert 'retries' not in counters
+
+
+def test_schedule_replays_finished_objects(tmp_path, monkeypatch, capsys):
+    corpus, fetched = replay(tmp_path, monkeypatch, PAGES)
+    pik = load_site('pik')
+    argv = ['--workers', '0', '--replay', corpus, '--schedule', str(tmp_path / 'schedule.sqlite')]
+
+    outputs = []
+    for _ in range(2):
+        fetched.clear()
+        pik.main(pik.parse_args(argv))
+        outputs.append(json.loads(capsys.readouterr().out))
+
+    assert len(outputs[0]) == 1
+    assert outputs[0][0]['article'] == 'A1'
+    # корпус не обходился: его объекты из прошлого обхода, без запроса квартиры
+    assert outputs[1] == outputs[0]
+    assert fetched == [CATALOGUE_URL]
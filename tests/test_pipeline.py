@@ -0,0 +1,74 @@
+from common.parse_pool import ParsePool
+from common.pipeline import Job, Pipeline
+from common.stats import STATS
+
+PAGES = 4
+
+
+def parse_pages(page):
+    for n in range(2, PAGES + 1):
+        yield Job(f'list{n}', 'listing', (n,))
+    yield from parse_listing(page, 1)
+
+
+def parse_listing(page, n):
+    for c in 'abc':
+        yield Job(f'c{n}-{c}', 'complex')
+
+
+def parse_complex(page):
+    yield {'url': page.decode()}
+
+
+HANDLERS = {'pages': parse_pages, 'listing': parse_listing, 'complex': parse_complex}
+
+
+def test_prefetch_order():
+    fetched, open_pages = [], []
+
+    def fetch(url):
+        fetched.append(url)
+        open_pages.append(len(pipeline._open))
+        return url.encode()
+
+    out = []
+    pipeline = Pipeline(fetch, ParsePool(HANDLERS, None, 0), out.append, prefetch=('listing',))
+    pipeline.run([Job('list1', 'pages')])
+    STATS.pop()
+
+    assert len(out) == PAGES * 3
+    assert fetched[0] == 'list1'
+    # следующая страница списка загружена до комплексов первой
+    assert fetched.index('list2') < fetched.index('c1-a')
+    # первая страница тоже открыта: третья - только после ее комплексов
+    assert fetched.index('list3') > max(fetched.index(f'c1-{c}') for c in 'abc')
+    # комплексы - по порядку страниц, первая страница первой
+    complexes = [int(url[1]) for url in fetched if url.startswith('c')]
+    assert complexes == sorted(complexes)
+    # открыто не больше lookahead страниц списка
+    assert max(open_pages) <= pipeline.lookahead
+
+
+def test_schedule_budget_checked_at_fetch(tmp_path, monkeypatch):
+    import time
+
+    from common import pipeline as pipeline_module
+    from common.schedule import Schedule
+
+    schedule = Schedule()
+    monkeypatch.setattr(pipeline_module, 'SCHEDULE', schedule)
+    schedule.open(str(tmp_path / 'schedule.sqlite'), 'test', budget=0.2)
+
+    def fetch(url):
+        time.sleep(0.1)
+        return url.encode()
+
+    out = []
+    # все комплексы в очереди сразу, как у ama и PIK
+    jobs = [Job(f'c1-{n}', 'complex') for n in range(15)]
+    Pipeline(fetch, ParsePool(HANDLERS, None, 0), out.append, recrawl=('complex',)).run(jobs)
+    schedule.close()
+    counters = STATS.pop()['counters']
+
+    assert len(out) == counters['schedule:due'] < 15
+    assert counters['schedule:due'] + counters['schedule:carried'] == 15
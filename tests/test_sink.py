@@ -0,0 +1,40 @@
+import sqlite3
+
+from common.sink import Sink
+
+# две одинаковые по ключу квартиры без номера, разные цены
+UNITS = [
+    {'complex': 'A', 'building': '1', 'floor': 2, 'rooms': 1, 'area': 30.5, 'price_base': 100},
+    {'complex': 'A', 'building': '1', 'floor': 2, 'rooms': 1, 'area': 30.5, 'price_base': 200},
+]
+
+
+def load(path, site, records, batch_size=1):
+    sink = Sink()
+    sink.open(path, site, batch_size)
+    for record in records:
+        sink.add(record)
+    sink.close()
+
+
+def units(path):
+    with sqlite3.connect(path) as db:
+        return sorted(db.execute('SELECT key, site, price_base FROM units'))
+
+
+def test_occurrence_independent_of_order(tmp_path):
+    path = str(tmp_path / 'units.sqlite')
+    load(path, 'abscity', UNITS)
+    first = units(path)
+    load(path, 'abscity', UNITS[::-1])
+    assert units(path) == first
+    with sqlite3.connect(path) as db:
+        # второй запуск ничего не изменил - новых строк истории нет
+        assert db.execute('SELECT count(*) FROM history').fetchone()[0] == 2
+
+
+def test_key_includes_site(tmp_path):
+    path = str(tmp_path / 'units.sqlite')
+    load(path, 'abscity', UNITS[:1])
+    load(path, 'ama', UNITS[:1])
+    assert sorted(site for _, site, _ in units(path)) == ['abscity', 'ama']
@@ -0,0 +1,38 @@
+from common.stats import Stats
+
+
+def test_prometheus_gauge_typed_once():
+    stats = Stats()
+    stats.gauge('maxrss:parse', 10)
+    stats.gauge('maxrss:main', 20)
+    stats.gauge('lag', 1)
+    lines = stats.to_prometheus().splitlines()
+    assert lines.count('# TYPE parsers_maxrss gauge') == 1
+    assert lines.count('# TYPE parsers_lag gauge') == 1
+    assert 'parsers_maxrss{process="main"} 20.000000' in lines
+    assert 'parsers_maxrss{process="parse"} 10.000000' in lines
+    # TYPE - перед всеми значениями метрики
+    typed = lines.index('# TYPE parsers_maxrss gauge')
+    assert typed < lines.index('parsers_maxrss{process="main"} 20.000000')
+
+
+def test_prometheus_labels_and_types():
+    stats = Stats()
+    stats.add_time('fetch', 1.5)
+    stats.add_time('lane:ama.ru', 2)
+    stats.incr('requests', 3)
+    stats.incr('rejected:rooms')
+    stats.incr('lane_requests:ama.ru', 4)
+    stats.incr('db:rows', 5)
+    stats.gauge('pace:ama.ru', 2)
+    lines = stats.to_prometheus().splitlines()
+    # время полосы - не стадия
+    assert [line for line in lines if line.startswith('parsers_stage_seconds')] == \
+        ['parsers_stage_seconds{stage="fetch"} 1.500000']
+    assert 'parsers_lane_seconds{host="ama.ru"} 2.000000' in lines
+    assert 'parsers_lane_requests_total{host="ama.ru"} 4' in lines
+    assert 'parsers_rejected_total{reason="rooms"} 1' in lines
+    assert 'parsers_db_total{kind="rows"} 5' in lines
+    assert 'parsers_pace{host="ama.ru"} 2.000000' in lines
+    for name in ('requests_total', 'rejected_total', 'lane_requests_total', 'db_total', 'lane_seconds'):
+        assert lines.count(f'# TYPE parsers_{name} counter') == 1